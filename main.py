@@ -1,8 +1,26 @@
+import argparse
 import tkinter as tk
+from src.api.recording import recorder, replayer
 from src.gui.trading_gui import TradingGUI
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IBKR Trading Bot")
+    parser.add_argument("--record", metavar="CASSETTE", help="append all gateway traffic to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="serve gateway traffic from a cassette instead")
+    parser.add_argument("--fast", action="store_true", help="replay without the recorded response latency")
+    parser.add_argument("--profile", action="store_true", help="write a folded-stack profile per strategy execution")
+    parser.add_argument("--workers", type=int, default=0, metavar="N",
+                        help="evaluate strategies in N worker processes fed from a shared quote book")
+    parser.add_argument("--lag-threshold", type=float, metavar="SECONDS", help="report event loop stalls longer than this")
+    args = parser.parse_args()
+    transport = None
+    if args.record:
+        transport = recorder(args.record)
+    elif args.replay:
+        transport = replayer(args.replay, realtime=not args.fast)
+
     root = tk.Tk()
-    root.geometry("600x500")  # Установить размер окна
-    app = TradingGUI(root)
-    root.mainloop()
\ No newline at end of file
+    root.geometry("700x700")  # Установить размер окна
+    app = TradingGUI(root, transport=transport, profile=args.profile, lag_threshold=args.lag_threshold,
+                     workers=args.workers)
+    root.mainloop()
@@ -0,0 +1,117 @@
+import asyncio
+import re
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from src.api.resilience import CircuitOpenError, EndpointHealth
+
+KEEPALIVE_SECONDS = 60
+# Order submits, modifies, cancels and confirmations are not idempotent: a
+# client-side timeout does not stop the order, so they get a fixed generous one
+ORDER_TIMEOUT = 20.0
+ORDER_PATHS = re.compile(r"/iserver/(?:account/[^/]+/orders?(?:/[^/]+)?|reply/[^/]+)")
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Loop time, so a replay on a fast-forwarding loop paces in virtual time
+        async with self._lock:
+            while True:
+                now = asyncio.get_running_loop().time()
+                if self.updated is None:
+                    self.updated = now
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Gateway:
+    def __init__(self, gateway_id, url, rate=10, pool_size=10, transport=None):
+        self.id = gateway_id
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+        self.session.verify = False
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # A transport factory can wrap the session to record traffic or replace it to replay a cassette
+        self.transport = transport(gateway_id, self.session) if transport else self.session
+        # Own executor so a slow gateway cannot starve the others of worker threads
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix=f"gw-{gateway_id}")
+        self.limiter = RateLimiter(rate)
+        self.health = EndpointHealth()
+        self._keepalive = None
+
+    async def request(self, method, path, timeout=None, sent=None, **kwargs):
+        # Without an explicit timeout the endpoint's observed latency sets one,
+        # except for order endpoints which always get ORDER_TIMEOUT
+        key = self.health.key(method, path)
+        breaker = self.health.breaker(key)
+        if not breaker.allow():
+            raise CircuitOpenError(f"[{self.id}] {key} circuit open")
+        tracker = self.health.tracker(key)
+        if timeout is None:
+            timeout = ORDER_TIMEOUT if method != "GET" and ORDER_PATHS.fullmatch(path) else tracker.timeout()
+        await self.limiter.acquire()
+        if sent is not None:
+            # Lets a hedge time the request from when it leaves, not while it queues for a token
+            sent.set()
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            resp = await loop.run_in_executor(
+                self.executor,
+                lambda: self.transport.request(method, f"{self.url}{path}", timeout=timeout, **kwargs),
+            )
+        except requests.Timeout:
+            # A timeout is a sample too, or the adaptive timeout could only ever shrink
+            tracker.record(max(time.monotonic() - started, timeout))
+            breaker.failure()
+            raise
+        except requests.RequestException:
+            breaker.failure()
+            raise
+        tracker.record(time.monotonic() - started)
+        if resp.status_code >= 500:
+            breaker.failure()
+        else:
+            breaker.success()
+        return resp
+
+    def hedge_delay(self, method, path):
+        return self.health.tracker(self.health.key(method, path)).hedge_delay()
+
+    def start_keepalive(self, log):
+        if self._keepalive is None or self._keepalive.done():
+            self._keepalive = asyncio.create_task(self._tickle_loop(log))
+
+    def stop_keepalive(self):
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+            self._keepalive = None
+
+    async def _tickle_loop(self, log):
+        while True:
+            await asyncio.sleep(KEEPALIVE_SECONDS)
+            try:
+                r = await self.request("POST", "/tickle")
+                if r.status_code != 200:
+                    log(f"[{self.id}] Keep-alive failed: {r.status_code}, {r.text}")
+            except requests.RequestException as e:
+                log(f"[{self.id}] Keep-alive error: {e}")
+
+    def close(self):
+        self.stop_keepalive()
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -1,147 +1,314 @@
+import asyncio
+import bisect
 import requests
-import pandas as pd
-import json
 from datetime import datetime
+from src.api import schemas
+from src.api.gateway import Gateway
+from src.api.resilience import hedged
+from src.api.schemas import Option
+from src.config.underlyings import UNDERLYINGS
 from src.utils.logging import logger
 
 BASE_URL = "https://localhost:5000/v1/api"
+STRIKE_WINDOW = 5
+SNAPSHOT_FIELDS = "31,84,86,7308"
+MAX_RECENTER = 2
+QUOTE_TTL = 5
+CONTRACT_TTL = 3600
+MAX_CONFIRMS = 3
+FINAL_TIMEOUT = 10
+FINAL_POLL = 0.5
+
 
 class IBKRClient:
-    def __init__(self, log_callback):
+    def __init__(self, log_callback, gateway=None, accounts=None, validate=None, confirm=None):
         self.session_id = None
         self.authenticated = False
         self.account_id = None
+        self.accounts = []
+        self.configured_accounts = list(accounts or [])
+        self.gateway = gateway or Gateway("main", BASE_URL)
         self.log = log_callback
+        self.validate = schemas.VALIDATE if validate is None else validate
+        # Order warning message ids (e.g. "o354") answered yes; any other prompt is declined
+        self.confirm = frozenset(confirm or ())
+        # Called with every decoded snapshot, e.g. to publish into a shared quote book
+        self.quote_sink = None
+        self._conids = {}
+        self._strikes = {}
+        self._contracts = {}
+        self._prices = {}
+        self._windows = {}
 
     async def authenticate(self):
         try:
-            validate = requests.get(f"{BASE_URL}/sso/validate", verify=False, timeout=5)
+            validate = await self.gateway.request("GET", "/sso/validate")
             if validate.status_code != 200:
-                self.log(f"Session validation failed: {validate.status_code}, {validate.text}")
+                self.log(f"[{self.gateway.id}] Session validation failed: {validate.status_code}, {validate.text}")
                 return False
 
-            tickle = requests.get(f"{BASE_URL}/tickle", verify=False, timeout=5)
-            if tickle.status_code == 200 and tickle.json().get("session"):
-                self.session_id = tickle.json()["session"]
+            tickle = await self.gateway.request("GET", "/tickle")
+            session = schemas.decode_session(tickle.content, self.validate) if tickle.status_code == 200 else None
+            if session:
+                self.session_id = session
                 self.authenticated = True
-                self.log("Authenticated with IBKR API")
+                self.log(f"[{self.gateway.id}] Authenticated with IBKR API")
 
-                acct = requests.get(f"{BASE_URL}/iserver/accounts", verify=False, timeout=5)
+                acct = await self.gateway.request("GET", "/iserver/accounts")
                 if acct.status_code == 200:
-                    accts = acct.json().get("accounts", [])
-                    self.account_id = accts[0] if accts else None
+                    self.accounts = schemas.decode_accounts(acct.content, self.validate)
+                    missing = [a for a in self.configured_accounts if a not in self.accounts]
+                    if missing:
+                        self.log(f"[{self.gateway.id}] Accounts not served by gateway: {missing}")
+                    served = [a for a in self.configured_accounts if a in self.accounts] or self.accounts
+                    self.account_id = served[0] if served else None
                     if self.account_id:
-                        self.log(f"Fetched account ID: {self.account_id}")
+                        self.log(f"[{self.gateway.id}] Fetched account ID: {self.account_id}")
                         return True
-                self.log(f"Failed to fetch account ID: {acct.status_code}, {acct.text}")
+                self.log(f"[{self.gateway.id}] Failed to fetch account ID: {acct.status_code}, {acct.text}")
             else:
-                self.log(f"Authentication failed: {tickle.status_code}, {tickle.text}")
+                self.log(f"[{self.gateway.id}] Authentication failed: {tickle.status_code}, {tickle.text}")
             return False
-        except requests.RequestException as e:
-            self.log(f"Authentication error: {e}")
+        except (requests.RequestException, ValueError) as e:
+            self.log(f"[{self.gateway.id}] Authentication error: {e}")
             return False
 
-    async def get_option_chain(self, symbol, expiration_date):
+    def serves(self, account_id):
+        return account_id in self.accounts
+
+    async def _get(self, path, **params):
+        return await self.gateway.request("GET", path, params=params)
+
+    async def _shared(self, cache, key, factory, ttl=None):
+        # Concurrent callers asking for the same key share one in-flight request;
+        # empty or failed results are dropped so the next caller retries
+        now = asyncio.get_running_loop().time()
+        entry = cache.get(key)
+        if entry is None or (ttl is not None and now - entry[0] > ttl):
+            entry = (now, asyncio.ensure_future(factory()))
+            cache[key] = entry
         try:
-            if not self.authenticated:
-                if not await self.authenticate():
-                    return None
+            result = await asyncio.shield(entry[1])
+        except Exception:
+            if cache.get(key) is entry:
+                del cache[key]
+            raise
+        if not result and cache.get(key) is entry:
+            del cache[key]
+        return result
+
+    async def get_underlying_conid(self, symbol):
+        return await self._shared(self._conids, symbol, lambda: self._fetch_underlying_conid(symbol))
+
+    async def _fetch_underlying_conid(self, symbol):
+        spec = UNDERLYINGS.get(symbol, {})
+        resp = await self._get("/iserver/secdef/search", symbol=symbol, secType=spec.get("secType", "IND"))
+        if resp.status_code != 200:
+            self.log(f"Failed to get {symbol} conid: {resp.status_code}, {resp.text}")
+            return None
+        data = schemas.decode_search(resp.content, self.validate)
+        if not data:
+            self.log(f"Invalid conid response: {resp.text}")
+            return None
+        conid = next((d for d in data if d.description == spec.get("exchange")), data[0]).conid
+        self.log(f"Fetched {symbol} conid: {conid}")
+        return conid
+
+    async def get_strikes(self, conid, month):
+        return await self._shared(self._strikes, (conid, month), lambda: self._fetch_strikes(conid, month))
+
+    async def _fetch_strikes(self, conid, month):
+        resp = await self._get("/iserver/secdef/strikes", conid=conid, secType="OPT", month=month)
+        if resp.status_code != 200:
+            self.log(f"Failed to get strikes: {resp.status_code}, {resp.text}")
+            return None
+        puts = schemas.decode_strikes(resp.content, "put", self.validate)
+        if not puts:
+            self.log(f"No put strikes for {month}")
+            return None
+        return puts
 
-            resp = requests.get(
-                f"{BASE_URL}/iserver/secdef/search?symbol={symbol}&exchange=CBOE", verify=False, timeout=5
-            )
+    async def get_snapshot(self, conids):
+        if not conids:
+            return {}
+        ids = ",".join(str(c) for c in conids)
+        quotes = {}
+        # The first snapshot for a conid only opens the subscription, so ask twice
+        for _ in range(2):
+            resp = await self._get("/iserver/marketdata/snapshot", conids=ids, fields=SNAPSHOT_FIELDS)
             if resp.status_code != 200:
-                self.log(f"Failed to get SPX conid: {resp.status_code}, {resp.text}")
-                return None
+                self.log(f"Snapshot failed: {resp.status_code}, {resp.text}")
+                return quotes
+            quotes.update(schemas.decode_snapshot(resp.content, self.validate))
+            if len(quotes) == len(conids):
+                break
+            await asyncio.sleep(0.2)
+        if quotes and self.quote_sink is not None:
+            self.quote_sink(quotes)
+        return quotes
 
-            data = resp.json()
-            if not isinstance(data, list) or not data:
-                self.log(f"Invalid conid response: {resp.text}")
-                return None
+    async def get_underlying_price(self, conid):
+        return await self._shared(self._prices, conid, lambda: self._fetch_price(conid), ttl=QUOTE_TTL)
+
+    async def _fetch_price(self, conid):
+        quote = (await self.get_snapshot([conid])).get(int(conid))
+        return quote.last if quote else None
+
+    async def _get_contracts(self, conid, month, strike):
+        return await self._shared(
+            self._contracts, (conid, month, strike), lambda: self._fetch_contracts(conid, month, strike),
+            ttl=CONTRACT_TTL,
+        )
+
+    @staticmethod
+    def _matching(contracts, month, strike):
+        # Keep only the puts asked for; the gateway may answer with other
+        # rights or months alongside them
+        return tuple(
+            c for c in contracts
+            if c.right == "P" and c.strike == strike and len(c.maturity) == 8
+            and datetime.strptime(c.maturity, "%Y%m%d").strftime("%b%y").upper() == month
+        )
+
+    async def _fetch_contracts(self, conid, month, strike):
+        params = {"conid": conid, "secType": "OPT", "month": month, "right": "P", "strike": strike}
+
+        async def info(sent=None):
+            resp = await self.gateway.request("GET", "/iserver/secdef/info", params=params, sent=sent)
+            if resp.status_code != 200:
+                self.log(f"Failed to get chain: {resp.status_code}, {resp.text}")
+                return ()
+            return self._matching(schemas.decode_secdef_info(resp.content, self.validate), month, strike)
+
+        # Only secdef/info answers with the option itself, so the hedge is a
+        # second copy of it, raced once the first has been on the wire past its p95
+        sent = asyncio.Event()
+        delay = self.gateway.hedge_delay("GET", "/iserver/secdef/info")
+        return await hedged(lambda: info(sent), info, delay, bool, started=sent)
+
+    @staticmethod
+    def strike_window(strikes, center, window):
+        i = bisect.bisect_left(strikes, center)
+        if i == len(strikes) or (i > 0 and center - strikes[i - 1] <= strikes[i] - center):
+            i -= 1
+        return tuple(strikes[max(i - window, 0):i + window + 1])
+
+    async def _window_options(self, conid, month, exp, strikes, center, window):
+        selected = self.strike_window(strikes, center, window)
+        return await self._shared(
+            self._windows, (conid, exp, selected),
+            lambda: self._fetch_window(conid, month, exp, selected), ttl=QUOTE_TTL
+        )
 
-            conid = data[0]["conid"]
-            self.log(f"Fetched SPX conid: {conid}")
+    async def _fetch_window(self, conid, month, exp, selected):
+        chains = await asyncio.gather(*(self._get_contracts(conid, month, k) for k in selected))
+        contracts = [c for chain in chains for c in chain if c.right == "P" and c.maturity == exp]
+        quotes = await self.get_snapshot([c.conid for c in contracts])
+        options = []
+        for c in contracts:
+            q = quotes.get(c.conid)
+            if q is None:
+                options.append(Option(c.conid, c.strike, c.right, c.maturity, 0.0, None, None, None))
+            else:
+                delta = abs(q.delta) if q.delta is not None else None
+                options.append(Option(c.conid, c.strike, c.right, c.maturity, q.last or 0.0, q.bid, q.ask, delta))
+        return options
+
+    @staticmethod
+    def _delta_edge(options, target):
+        # Put deltas grow with strike: if the whole window misses the target,
+        # return the edge strike to recenter on
+        priced = sorted((o.strike, o.delta) for o in options if o.delta is not None)
+        if not priced:
+            return None
+        if priced[-1][1] < target:
+            return priced[-1][0]
+        if priced[0][1] > target:
+            return priced[0][0]
+        return None
 
+    async def prefetch_chain(self, symbol, expiration_date, window=STRIKE_WINDOW):
+        # Warm the definition caches ahead of an entry; quotes are left for entry time
+        try:
+            conid = await self.get_underlying_conid(symbol)
+            if conid is None:
+                return
             month = expiration_date.strftime('%b%y').upper()
-            exp = expiration_date.strftime('%Y%m%d')
+            strikes = await self.get_strikes(conid, month)
+            center = await self.get_underlying_price(conid)
+            if not strikes or center is None:
+                return
+            selected = self.strike_window(strikes, center, window)
+            await asyncio.gather(*(self._get_contracts(conid, month, k) for k in selected))
+        except Exception as e:
+            self.log(f"Error prefetching {symbol} chain: {e}")
+
+    async def get_option_chain(self, symbol, expiration_date, window=STRIKE_WINDOW, center=None, target_delta=None):
+        try:
+            if not self.authenticated:
+                if not await self.authenticate():
+                    return None
 
-            strikes = requests.get(
-                f"{BASE_URL}/iserver/secdef/strikes?conid={conid}&secType=OPT&month={month}",
-                verify=False, timeout=5
-            )
-            if strikes.status_code != 200:
-                self.log(f"Failed to get strikes: {strikes.status_code}, {strikes.text}")
+            conid = await self.get_underlying_conid(symbol)
+            if conid is None:
                 return None
 
-            puts = strikes.json().get("put", [])
-            if not puts:
-                self.log(f"No put strikes for {month}")
+            month = expiration_date.strftime('%b%y').upper()
+            exp = expiration_date.strftime('%Y%m%d')
+
+            strikes = await self.get_strikes(conid, month)
+            if not strikes:
                 return None
 
-            target = 5950.0
-            if target not in puts:
-                target = min(puts, key=lambda x: abs(x - target))
-                self.log(f"Adjusted strike: {target}")
-
-            info = requests.get(
-                f"{BASE_URL}/iserver/secdef/info?conid={conid}&secType=OPT&month={month}&right=P&strike={target}",
-                verify=False, timeout=5
-            )
-            if info.status_code != 200:
-                self.log(f"Failed to get chain: {info.status_code}, {info.text}")
-                fallback = requests.post(
-                    f"{BASE_URL}/trsrv/secdef", json={"conids": [conid]}, verify=False, timeout=5
-                )
-                if fallback.status_code != 200:
-                    self.log(f"Fallback failed: {fallback.status_code}, {fallback.text}")
+            if center is None:
+                center = await self.get_underlying_price(conid)
+                if center is None:
+                    self.log(f"No live price for {symbol}")
                     return None
-                chain = fallback.json().get("secdef", [])
-            else:
-                chain = info.json()
-
-            days = (expiration_date - datetime.now()).days
-            price = 50.0 if days <= 4 else 55.0
 
-            options = [
-                {"conid": o["conid"], "strike": float(o["strike"]), "right": o.get("right", "P"),
-                 "last": price, "delta": 0.7, "expiry": o.get("maturityDate", "")}
-                for o in chain
-                if o.get("right", "P") == "P" and float(o["strike"]) == target and o.get("maturityDate", "") == exp
-            ]
+            options = list(await self._window_options(conid, month, exp, strikes, center, window))
+            if target_delta is not None and window:
+                for _ in range(MAX_RECENTER):
+                    edge = self._delta_edge(options, target_delta / 100)
+                    if edge is None:
+                        break
+                    known = {o.conid for o in options}
+                    more = await self._window_options(conid, month, exp, strikes, edge, window)
+                    more = [o for o in more if o.conid not in known]
+                    if not more:
+                        break
+                    options += more
             if not options:
-                self.log(f"No options for {month} on {exp} at {target}")
+                self.log(f"No {symbol} options for {month} on {exp} around {center}")
                 return None
 
-            self.log(f"Fetched chain for {exp} strike {target}, conid {options[0]['conid']}")
-            return {"options": options}
+            self.log(f"Fetched {symbol} chain for {exp}: {len(options)} strikes around {center}")
+            return {"options": options, "price": center}
         except Exception as e:
             self.log(f"Error fetching chain: {e}")
             return None
 
-    async def find_option(self, chain, target_delta):
+    async def find_option(self, chain, target_delta, strike=None):
         if not chain or not chain.get("options"):
             return None
-        df = pd.DataFrame(chain["options"])
-        if df.empty:
-            return None
-        puts = df[df["right"] == "P"].copy()
-        if puts.empty:
+        puts = [o for o in chain["options"] if o.right == "P" and (strike is None or o.strike == strike)]
+        if not puts:
             return None
-        puts["diff"] = abs(puts["delta"] - target_delta / 100)
-        opt = puts.loc[puts["diff"].idxmin()]
-        self.log(f"Selected option: conid={opt['conid']} expiry={opt['expiry']}")
+        priced = [o for o in puts if o.delta is not None]
+        if priced:
+            opt = min(priced, key=lambda o: abs(o.delta - target_delta / 100))
+        else:
+            opt = min(puts, key=lambda o: abs(o.strike - chain["price"]))
+        self.log(f"Selected option: conid={opt.conid} strike={opt.strike} expiry={opt.expiry}")
         return opt
 
-    async def validate_order(self, order, strategy_name):
+    async def validate_order(self, order, strategy_name, account_id=None):
+        account_id = account_id or self.account_id
         try:
-            if not self.account_id:
+            if not account_id:
                 self.log(f"[{strategy_name}] No account ID")
                 return False
-            resp = requests.post(
-                f"{BASE_URL}/iserver/account/{self.account_id}/order/whatif",
-                json=order,
-                verify=False
-            )
+            resp = await self.gateway.request("POST", f"/iserver/account/{account_id}/order/whatif", json=order)
             if resp.status_code == 200:
                 self.log(f"[{strategy_name}] Order validated: {resp.text}")
                 return True
@@ -150,4 +317,81 @@ class IBKRClient:
                 return False
         except Exception as e:
             self.log(f"[{strategy_name}] Validation error: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    async def _order_replies(self, resp, what):
+        # One reply per submitted order; an accepted order carries an order_id,
+        # anything else (reject or unanswered warning) comes back with it None
+        if resp.status_code != 200:
+            self.log(f"[{self.gateway.id}] {what} failed: {resp.status_code}, {resp.text}")
+            return []
+        replies = schemas.decode_order_reply(resp.content, self.validate)
+        for _ in range(MAX_CONFIRMS):
+            if all(r.order_id is not None or r.reply_id is None for r in replies):
+                break
+            replies = [answer for r in replies for answer in await self._confirm(r)]
+        return replies
+
+    async def _confirm(self, reply):
+        # Precautionary warnings hold the order until answered. Only prompts
+        # whose every message id is allow-listed are confirmed; the rest are
+        # declined so the order does not linger, and come back as a reject
+        if reply.order_id is not None or reply.reply_id is None:
+            return [reply]
+        text = " ".join(map(str, reply.message))
+        allowed = bool(reply.message_ids) and self.confirm.issuperset(reply.message_ids)
+        self.log(f"[{self.gateway.id}] {'Confirming' if allowed else 'Declining'} order warning "
+                 f"{list(reply.message_ids)}: {text}")
+        resp = await self.gateway.request("POST", f"/iserver/reply/{reply.reply_id}", json={"confirmed": allowed})
+        if not allowed or resp.status_code != 200:
+            if resp.status_code != 200:
+                self.log(f"[{self.gateway.id}] Reply failed: {resp.status_code}, {resp.text}")
+            return [schemas.OrderReply(None, None, None, reply.message, reply.message_ids)]
+        return schemas.decode_order_reply(resp.content, self.validate)
+
+    async def place_order(self, order, account_id=None):
+        account_id = account_id or self.account_id
+        resp = await self.gateway.request("POST", f"/iserver/account/{account_id}/order", json=order)
+        return await self._order_replies(resp, "Order")
+
+    async def modify_order(self, order_id, order, account_id=None):
+        account_id = account_id or self.account_id
+        resp = await self.gateway.request("POST", f"/iserver/account/{account_id}/order/{order_id}", json=order)
+        return await self._order_replies(resp, f"Modify {order_id}")
+
+    async def get_order_status(self, order_id):
+        resp = await self.gateway.request("GET", f"/iserver/account/order/status/{order_id}")
+        if resp.status_code != 200:
+            self.log(f"Order status failed for {order_id}: {resp.status_code}, {resp.text}")
+            return None
+        return schemas.decode_order_status(resp.content, self.validate)
+
+    async def get_trades(self):
+        resp = await self.gateway.request("GET", "/iserver/account/trades")
+        if resp.status_code != 200:
+            self.log(f"[{self.gateway.id}] Trades failed: {resp.status_code}, {resp.text}")
+            return []
+        return schemas.decode_trades(resp.content, self.validate)
+
+    async def execution_time(self, order_id, ref=None):
+        # When the gateway executed the order: its latest execution, matched by
+        # order id or by the cOID it was placed with. None if not reported yet
+        times = [t.time for t in await self.get_trades() if t.order_id == order_id or (ref and t.order_ref == ref)]
+        return max(times, default=None)
+
+    async def wait_for_final_status(self, order_id, timeout=FINAL_TIMEOUT):
+        # A 200 on a cancel only means the request was accepted; the order is
+        # settled once the gateway reports it Filled, Cancelled or Inactive
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            status = await self.get_order_status(order_id)
+            if status is not None and status.is_final:
+                return status
+            if loop.time() >= deadline:
+                return None
+            await asyncio.sleep(FINAL_POLL)
+
+    async def cancel_order(self, order_id, account_id=None):
+        account_id = account_id or self.account_id
+        return await self.gateway.request("DELETE", f"/iserver/account/{account_id}/order/{order_id}")
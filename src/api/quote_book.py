@@ -0,0 +1,113 @@
+import time
+from multiprocessing import shared_memory
+import numpy as np
+
+QUOTE_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("conid", "<i8"),
+    ("bid", "<f8"),
+    ("ask", "<f8"),
+    ("last", "<f8"),
+    ("delta", "<f8"),
+    ("ts", "<f8"),
+])
+CAPACITY = 4096
+
+
+class QuoteBook:
+    # Fixed array of quote rows in shared memory, one writer (the market data
+    # process) and any number of reader processes. Each row is guarded by a
+    # seqlock: the writer makes seq odd while it writes and even when done,
+    # and readers retry until they see the same even seq before and after.
+
+    def __init__(self, name=None, capacity=CAPACITY):
+        create = name is None
+        self.capacity = capacity
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=capacity * QUOTE_DTYPE.itemsize)
+        self.owner = create
+        self.rows = np.ndarray((capacity,), dtype=QUOTE_DTYPE, buffer=self.shm.buf)
+        if create:
+            self.rows[:] = 0
+        # Field views, so a row update touches the shared buffer directly
+        self.seq = self.rows["seq"]
+        self.conid = self.rows["conid"]
+        self._slots = {}
+        self._used = 0
+        # Conids the writer must not evict, e.g. legs of open positions
+        self.pinned = set()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def _slot(self, conid):
+        i = self._slots.get(conid)
+        if i is None:
+            found = np.flatnonzero(self.conid[:self.capacity] == conid)
+            if found.size:
+                i = int(found[0])
+                self._slots[conid] = i
+        return i
+
+    def _evict(self):
+        # Reuse the slot updated longest ago; readers notice the conid change
+        ts = self.rows["ts"].copy()
+        for conid in self.pinned:
+            i = self._slots.get(conid)
+            if i is not None:
+                ts[i] = np.inf
+        i = int(ts.argmin())
+        if np.isinf(ts[i]):
+            return None
+        self._slots.pop(int(self.conid[i]), None)
+        return i
+
+    def publish(self, conid, bid, ask, last, delta):
+        i = self._slot(conid)
+        if i is None:
+            if self._used < self.capacity:
+                i = self._used
+                self._used += 1
+            else:
+                i = self._evict()
+                if i is None:
+                    return False
+            self._slots[conid] = i
+        row = self.rows[i:i + 1]
+        self.seq[i] += 1
+        row["bid"], row["ask"], row["last"], row["delta"] = (
+            np.nan if v is None else v for v in (bid, ask, last, delta)
+        )
+        row["ts"] = time.time()
+        row["conid"] = conid
+        self.seq[i] += 1
+        return True
+
+    def publish_quotes(self, quotes):
+        for q in quotes.values():
+            self.publish(q.conid, q.bid, q.ask, q.last, q.delta)
+
+    def read(self, conid):
+        i = self._slot(conid)
+        if i is None:
+            return None
+        row = self.rows[i]
+        while True:
+            before = self.seq[i]
+            if before & 1:
+                continue
+            values = (float(row["bid"]), float(row["ask"]), float(row["last"]), float(row["delta"]), float(row["ts"]))
+            owner = int(row["conid"])
+            if self.seq[i] == before:
+                break
+        if owner != conid:
+            # The writer gave this slot to another conid since it was cached
+            del self._slots[conid]
+            return self.read(conid) if self._slot(conid) is not None else None
+        return values
+
+    def close(self):
+        self.rows = self.seq = self.conid = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
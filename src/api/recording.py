@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+import requests
+
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _dumps = lambda obj: json.dumps(obj, separators=(",", ":")).encode()
+    _loads = json.loads
+
+# Cassettes are JSON lines: a header with the recording start time, then one
+# entry per request with short keys:
+#   g gateway, t offset from start, m method, k request key, b request body,
+#   s status, d duration, r response body, e transport error
+
+
+def request_key(method, url, params=None):
+    parts = urlsplit(url)
+    query = urlencode(sorted((params or {}).items())) if params else parts.query
+    return f"{method} {parts.path}?{query}" if query else f"{method} {parts.path}"
+
+
+class Cassette:
+    def __init__(self, path):
+        self.path = path
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._file = open(path, "ab")
+        self._write({"start": datetime.now().isoformat()})
+
+    def _write(self, entry):
+        with self._lock:
+            self._file.write(_dumps(entry) + b"\n")
+            self._file.flush()
+
+    def append(self, gateway_id, started, method, key, body, duration, resp=None, error=None):
+        entry = {"g": gateway_id, "t": round(started - self.started, 6), "m": method, "k": key,
+                 "b": body, "d": round(duration, 6)}
+        if error is not None:
+            entry["e"] = f"{type(error).__name__}: {error}"
+        else:
+            entry["s"] = resp.status_code
+            entry["r"] = resp.text
+        self._write(entry)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingTransport:
+    def __init__(self, inner, cassette, gateway_id):
+        self.inner = inner
+        self.cassette = cassette
+        self.gateway_id = gateway_id
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        key = request_key(method, url, params)
+        started = time.monotonic()
+        try:
+            resp = self.inner.request(method, url, params=params, json=json, **kwargs)
+        except requests.RequestException as e:
+            self.cassette.append(self.gateway_id, started, method, key, json, time.monotonic() - started, error=e)
+            raise
+        self.cassette.append(self.gateway_id, started, method, key, json, time.monotonic() - started, resp)
+        return resp
+
+
+class ReplayResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+        self.content = text.encode()
+
+    def json(self):
+        return _loads(self.content)
+
+
+class ReplayTransport:
+    def __init__(self, entries, gateway_id, realtime=False):
+        self.realtime = realtime
+        self._lock = threading.Lock()
+        self._queues = defaultdict(deque)
+        for entry in entries:
+            if entry.get("g") == gateway_id:
+                self._queues[entry["k"]].append(entry)
+
+    def request(self, method, url, params=None, **kwargs):
+        key = request_key(method, url, params)
+        with self._lock:
+            pending = self._queues.get(key)
+            if not pending:
+                entry = None
+            elif len(pending) > 1:
+                entry = pending.popleft()
+            else:
+                # Keep serving the last answer to polls the recording ran out of
+                entry = pending[0]
+        if entry is None:
+            return ReplayResponse(404, '{"error":"not in cassette"}')
+        if self.realtime:
+            time.sleep(entry["d"])
+        if "e" in entry:
+            raise requests.ConnectionError(f"Replayed: {entry['e']}")
+        return ReplayResponse(entry["s"], entry["r"])
+
+
+class _FastForwardSelector:
+    def __init__(self, selector, loop):
+        self._selector = selector
+        self._loop = loop
+
+    def select(self, timeout=None):
+        if not timeout or self._loop.inflight:
+            return self._selector.select(timeout)
+        events = self._selector.select(0)
+        if not events:
+            self._loop.offset += timeout
+        return events
+
+    def __getattr__(self, name):
+        return getattr(self._selector, name)
+
+
+class FastForwardLoop(asyncio.SelectorEventLoop):
+    # Virtual clock for fast replays: when the loop would sleep until its next
+    # timer and no executor call is outstanding, it moves the clock forward
+    # instead. Monitor polls, reprice cadences and retry sleeps then cost no
+    # wall time, and what is left is the time spent in the code under test.
+
+    def __init__(self):
+        super().__init__()
+        self.offset = 0.0
+        self.inflight = 0
+        self._selector = _FastForwardSelector(self._selector, self)
+
+    def time(self):
+        return super().time() + self.offset
+
+    def run_in_executor(self, executor, func, *args):
+        future = super().run_in_executor(executor, func, *args)
+        self.inflight += 1
+        future.add_done_callback(self._executor_done)
+        return future
+
+    def _executor_done(self, _):
+        self.inflight -= 1
+
+
+def load(path):
+    with open(path, "rb") as f:
+        lines = [_loads(line) for line in f if line.strip()]
+    header = next((line for line in lines if "start" in line), {})
+    return header, [line for line in lines if "k" in line]
+
+
+def recorder(path):
+    cassette = Cassette(path)
+    return lambda gateway_id, session: RecordingTransport(session, cassette, gateway_id)
+
+
+def replayer(path, realtime=False):
+    _, entries = load(path)
+    return lambda gateway_id, session: ReplayTransport(entries, gateway_id, realtime)
+
+
+async def bench(path, strategy_ids=None, realtime=False):
+    from src.bot.trading_bot import IBKRBot
+    from src.config.strategies import STRATEGIES
+
+    header, entries = load(path)
+    bot = IBKRBot(lambda msg: None, transport=replayer(path, realtime))
+    recorded_at = datetime.fromisoformat(header["start"]) if "start" in header else datetime.now()
+    bot.clock = lambda: recorded_at
+    await asyncio.gather(*(c.authenticate() for c in bot.clients.values()))
+    # Fills reach the repricer through the position monitor, as in a live run
+    monitor = asyncio.create_task(bot.monitor_positions())
+    results = []
+    try:
+        for strat in STRATEGIES:
+            if strategy_ids and strat["id"] not in strategy_ids:
+                continue
+            started = time.perf_counter()
+            await bot.execute_strategy(strat)
+            results.append((strat["name"], time.perf_counter() - started))
+    finally:
+        monitor.cancel()
+        for c in bot.clients.values():
+            c.gateway.close()
+    recorded = max((e["t"] + e["d"] for e in entries), default=0) - min((e["t"] for e in entries), default=0)
+    print(f"Cassette {path}: {len(entries)} requests spanning {recorded:.3f}s as recorded")
+    for name, elapsed in results:
+        print(f"  {name}: {elapsed:.3f}s replayed ({'recorded pace' if realtime else 'fast'})")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a gateway cassette through the bot")
+    parser.add_argument("cassette")
+    parser.add_argument("--strategy", action="append", help="strategy id to execute (default: all)")
+    parser.add_argument("--realtime", action="store_true", help="replay at the recorded response latency")
+    args = parser.parse_args()
+    with asyncio.Runner(loop_factory=None if args.realtime else FastForwardLoop) as runner:
+        runner.run(bench(args.cassette, args.strategy, args.realtime))
@@ -0,0 +1,140 @@
+import asyncio
+import re
+import time
+import requests
+from collections import deque
+
+MIN_TIMEOUT = 0.5
+MAX_TIMEOUT = 10.0
+DEFAULT_TIMEOUT = 5.0
+MIN_SAMPLES = 20
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class LatencyTracker:
+    def __init__(self, size=200):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        self.samples.append(seconds)
+
+    def percentile(self, pct):
+        if len(self.samples) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+    def timeout(self):
+        # Generous multiple of p99 so slow-but-healthy calls still complete
+        p99 = self.percentile(99)
+        if p99 is None:
+            return DEFAULT_TIMEOUT
+        return min(max(p99 * 3, MIN_TIMEOUT), MAX_TIMEOUT)
+
+    def hedge_delay(self):
+        p95 = self.percentile(95)
+        return DEFAULT_TIMEOUT / 5 if p95 is None else p95
+
+
+class CircuitBreaker:
+    def __init__(self, threshold=5, cooldown=10.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state != "half-open":
+            return state == "closed"
+        # One probe at a time; a probe that never reports back frees the slot after a cooldown
+        now = time.monotonic()
+        if self.probe_at is not None and now - self.probe_at < self.cooldown:
+            return False
+        self.probe_at = now
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.probe_at = None
+
+    def failure(self):
+        self.failures += 1
+        self.probe_at = None
+        if self.failures >= self.threshold or self.opened_at is not None:
+            # A failed half-open probe re-opens for another cooldown
+            self.opened_at = time.monotonic()
+
+
+class EndpointHealth:
+    # Per-endpoint latency and breaker, keyed by path with ids collapsed so
+    # /iserver/account/U123/order/456 shares stats with every other order
+    _ids = re.compile(r"/(?:[A-Z]*\d+[\w.-]*)")
+
+    def __init__(self, threshold=5, cooldown=10.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.latency = {}
+        self.breakers = {}
+
+    def key(self, method, path):
+        return f"{method} {self._ids.sub('/{id}', path)}"
+
+    def tracker(self, key):
+        if key not in self.latency:
+            self.latency[key] = LatencyTracker()
+        return self.latency[key]
+
+    def breaker(self, key):
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(self.threshold, self.cooldown)
+        return self.breakers[key]
+
+
+async def hedged(primary, alternate, delay, ok, started=None):
+    # Start primary; if it has no good answer `delay` after it started (or
+    # after the `started` event is set), race the alternate and return the
+    # first result that passes `ok`
+    first = asyncio.ensure_future(primary())
+    if started is not None:
+        waiter = asyncio.ensure_future(started.wait())
+        await asyncio.wait({first, waiter}, return_when=asyncio.FIRST_COMPLETED)
+        waiter.cancel()
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done and _good(first, ok):
+        return first.result()
+    pending = {first} if not done else set()
+    pending.add(asyncio.ensure_future(alternate()))
+    result = first.result() if done and first.exception() is None else None
+    error = first.exception() if done else None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if _good(task, ok):
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            if task.exception() is None:
+                result = task.result()
+            else:
+                error = task.exception()
+    if result is None and error is not None:
+        raise error
+    return result
+
+
+def _good(task, ok):
+    return task.exception() is None and ok(task.result())
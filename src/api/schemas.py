@@ -0,0 +1,213 @@
+import os
+from array import array
+from dataclasses import dataclass
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
+# Strict mode checks every payload against its schema and raises SchemaError
+# with the offending shape instead of failing later on a KeyError
+VALIDATE = os.environ.get("IBKR_VALIDATE_RESPONSES", "") == "1"
+
+
+class SchemaError(ValueError):
+    pass
+
+
+@dataclass(slots=True, frozen=True)
+class SearchResult:
+    conid: int
+    symbol: str
+    description: str
+
+
+@dataclass(slots=True, frozen=True)
+class Contract:
+    conid: int
+    strike: float
+    right: str
+    maturity: str
+
+
+@dataclass(slots=True, frozen=True)
+class Quote:
+    conid: int
+    last: float | None
+    bid: float | None
+    ask: float | None
+    delta: float | None
+
+
+@dataclass(slots=True, frozen=True)
+class Option:
+    conid: int
+    strike: float
+    right: str
+    expiry: str
+    last: float
+    bid: float | None
+    ask: float | None
+    delta: float | None
+
+
+@dataclass(slots=True, frozen=True)
+class OrderReply:
+    order_id: str | None
+    order_status: str | None
+    reply_id: str | None
+    message: tuple
+    message_ids: tuple = ()
+
+
+@dataclass(slots=True, frozen=True)
+class OrderStatus:
+    order_id: str
+    status: str
+    filled: float
+    remaining: float | None
+    avg_price: float | None
+
+    @property
+    def is_filled(self):
+        return self.status == "Filled"
+
+    @property
+    def is_final(self):
+        # PendingSubmit and PendingCancel can still turn into a fill
+        return self.status in ("Filled", "Cancelled", "Inactive")
+
+
+@dataclass(slots=True, frozen=True)
+class Trade:
+    execution_id: str
+    order_id: str
+    order_ref: str
+    time: float
+
+
+def _price(value):
+    # Snapshot prices may carry a prefix such as "C" (prior close) or "H" (halted)
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(value.lstrip("CH"))
+    except ValueError:
+        return None
+
+
+def _check(cond, what, payload):
+    if not cond:
+        raise SchemaError(f"Unexpected {what} payload: {str(payload)[:200]}")
+
+
+def _strict(validate):
+    return VALIDATE if validate is None else validate
+
+
+def decode_session(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, dict), "tickle", data)
+    return data.get("session")
+
+
+def decode_accounts(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, dict) and isinstance(data.get("accounts", []), list), "accounts", data)
+    return data.get("accounts", [])
+
+
+def decode_search(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, list) and all("conid" in d for d in data), "secdef search", data)
+    if not isinstance(data, list):
+        return []
+    return [SearchResult(int(d["conid"]), d.get("symbol", ""), d.get("description", "")) for d in data]
+
+
+def decode_strikes(content, right="put", validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, dict) and isinstance(data.get(right, []), list), "strikes", data)
+    strikes = array("d", data.get(right, ()))
+    # The gateway already returns ascending strikes; only sort when it did not
+    if any(strikes[i] > strikes[i + 1] for i in range(len(strikes) - 1)):
+        strikes = array("d", sorted(strikes))
+    return strikes
+
+
+def _contracts(rows, validate):
+    if _strict(validate):
+        _check(isinstance(rows, list) and all("conid" in o and "strike" in o for o in rows), "secdef", rows)
+    return tuple(
+        Contract(int(o["conid"]), float(o["strike"]), o.get("right", "P"), o.get("maturityDate", ""))
+        for o in rows
+    )
+
+
+def decode_secdef_info(content, validate=None):
+    return _contracts(_loads(content), validate)
+
+
+def decode_snapshot(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, list) and all("conid" in row for row in data), "snapshot", data)
+    quotes = {}
+    for row in data:
+        if "31" in row or "7308" in row:
+            conid = int(row["conid"])
+            quotes[conid] = Quote(
+                conid, _price(row.get("31")), _price(row.get("84")), _price(row.get("86")), _price(row.get("7308"))
+            )
+    return quotes
+
+
+def decode_order_reply(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, list) and all(isinstance(d, dict) for d in data), "order reply", data)
+    if not isinstance(data, list):
+        return []
+    return [
+        OrderReply(
+            d.get("order_id"), d.get("order_status"), d.get("id"),
+            tuple(d.get("message", ())), tuple(d.get("messageIds", ())),
+        )
+        for d in data
+    ]
+
+
+def decode_trades(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, list) and all("trade_time_r" in d for d in data), "trades", data)
+    if not isinstance(data, list):
+        return []
+    # trade_time_r is the execution time in epoch milliseconds
+    return [
+        Trade(str(d.get("execution_id", "")), str(d.get("order_id", "")), d.get("order_ref") or "",
+              d["trade_time_r"] / 1000)
+        for d in data if "trade_time_r" in d
+    ]
+
+
+def decode_order_status(content, validate=None):
+    data = _loads(content)
+    if _strict(validate):
+        _check(isinstance(data, dict) and "order_status" in data, "order status", data)
+    return OrderStatus(
+        str(data.get("order_id", "")),
+        data.get("order_status", ""),
+        _price(data.get("cum_fill")) or 0.0,
+        _price(data.get("remaining_quantity")),
+        _price(data.get("average_price")),
+    )
@@ -0,0 +1,168 @@
+import asyncio
+import math
+import uuid
+from src.bot.tca import CANCEL, FILL, MODIFY, SUBMIT
+
+REPRICE_SECONDS = 5
+REPRICE_STEPS = 5
+MULTIPLIER = 100
+TICK = 0.05
+
+
+def _round(price):
+    return round(round(price / TICK) * TICK, 2)
+
+
+def mid_price(bid, ask, last=None):
+    # Missing sides come as None from snapshots and NaN from the quote book
+    if bid is None or ask is None or math.isnan(bid) or math.isnan(ask):
+        return last
+    return (bid + ask) / 2
+
+
+def combo_prices(near, far):
+    # The calendar sells the near leg and buys the far one: mid is the fair
+    # value, far side is what crossing both spreads would cost
+    if None in (near.bid, near.ask, far.bid, far.ask):
+        return None, None
+    mid = _round(abs(mid_price(far.bid, far.ask) - mid_price(near.bid, near.ask)))
+    far_side = _round(abs(far.ask - near.bid))
+    return mid, max(far_side, mid)
+
+
+def price_cap(strat, qty):
+    return strat["MaxCost"] / (qty * MULTIPLIER)
+
+
+def price_ladder(start, far_side, cap, steps):
+    end = min(far_side, cap)
+    if end <= start or steps <= 0:
+        return []
+    return [_round(start + (end - start) * i / steps) for i in range(1, steps + 1)]
+
+
+class RepricingEngine:
+    def __init__(self, bot):
+        self.bot = bot
+        # Held while an entry's order is being changed, so a cancel never races a replace
+        self._locks = {}
+
+    def _lock(self, sid):
+        return self._locks.setdefault(sid, asyncio.Lock())
+
+    async def _reprice(self, pos, price):
+        client, account = pos["client"], pos["account"]
+        order = {**pos["order"], "price": float(price)}
+        replies = await client.modify_order(pos["order_id"], order, account)
+        if replies and replies[0].order_id is not None:
+            pos["order"] = order
+            return True
+        # The gateway refuses some modifies (e.g. order in transit); fall back to cancel/replace
+        self.bot.log(f"[{pos['strategy']['name']}] Modify failed, replacing order")
+        cancel = await client.cancel_order(pos["order_id"], account)
+        if cancel.status_code != 200:
+            return False
+        self.bot.record_fill_event(CANCEL, pos["strategy"], pos["order_id"])
+        # The replacement may only go out once the old order can no longer fill
+        status = await client.wait_for_final_status(pos["order_id"])
+        if status is None:
+            self.bot.log(f"[{pos['strategy']['name']}] Cancel of {pos['order_id']} not confirmed, not replacing")
+            return False
+        if status.filled:
+            # Filled in full or in part before the cancel landed: that is the position
+            pos["qty"] = int(status.filled)
+            pos["filled"] = True
+            pos["fill_price"] = status.avg_price
+            if self.bot.fills is not None:
+                self.bot.record_fill_event(
+                    FILL, pos["strategy"], pos["order_id"], status.filled, pos["price"], fill=status.avg_price,
+                    ts=await client.execution_time(pos["order_id"], pos["order"].get("cOID")),
+                )
+            return False
+        order["cOID"] = str(uuid.uuid4())
+        replies = await client.place_order(order, account)
+        if not replies or replies[0].order_id is None:
+            # Nothing is working any more; the ladder's final cancel finds it settled
+            return False
+        self.bot.forget_fill_event(pos["order_id"])
+        replaced, pos["order_id"] = pos["order_id"], replies[0].order_id
+        pos["order"] = order
+        self.bot.record_fill_event(SUBMIT, pos["strategy"], pos["order_id"], pos["qty"], price, parent=replaced)
+        return True
+
+    async def work(self, sid, start, far_side):
+        # Walk the limit from start toward the far side, stopping on the first fill
+        pos = self.bot.positions.get(sid)
+        if pos is None:
+            return None
+        strat = pos["strategy"]
+        name = strat["name"]
+        cadence = strat.get("RepriceSeconds", REPRICE_SECONDS)
+        ladder = price_ladder(start, far_side, price_cap(strat, pos["qty"]), strat.get("RepriceSteps", REPRICE_STEPS))
+        for price in ladder + [None]:
+            filled = await self.bot.wait_for_fill(pos["order_id"], cadence)
+            if pos.get("cancel") is not None:
+                # cancel_entry took the order over; the flatten closes whatever filled
+                return None
+            if filled:
+                fill = pos.get("fill_price") or pos["price"]
+                self.bot.log(f"[{name}] Filled at {fill}")
+                return fill
+            if price is None:
+                break
+            async with self._lock(sid):
+                if pos.get("cancel") is not None:
+                    return None
+                repriced = await self._reprice(pos, price)
+            if repriced:
+                pos["price"] = price
+                self.bot.record_fill_event(MODIFY, strat, pos["order_id"], pos["qty"], price)
+                self.bot.log(f"[{name}] Repriced to {price}")
+            else:
+                self.bot.log(f"[{name}] Reprice to {price} failed")
+        self.bot.log(f"[{name}] Not filled up to {pos['price']}, canceling entry")
+        status = await self.cancel_entry(sid)
+        if status is None or pos.get("flatten"):
+            # Unconfirmed cancels stay tracked; a flatten owns whatever filled
+            return None
+        if not status.filled:
+            self.bot.positions.pop(sid, None)
+            self.bot.forget_fill_event(pos["order_id"])
+            self._locks.pop(sid, None)
+            return None
+        # Filled in full or in part before the cancel landed: that is the position
+        pos["qty"] = int(status.filled)
+        pos["filled"] = True
+        pos["fill_price"] = status.avg_price
+        self.bot.log(f"[{name}] Filled {pos['qty']} at {status.avg_price}")
+        return status.avg_price or pos["price"]
+
+    async def cancel_entry(self, sid):
+        # Stop working the entry, pull its order and wait until the gateway
+        # reports it done; returns that final status (its filled quantity is
+        # what is actually held) or None if it could not be confirmed.
+        # Concurrent callers (the ladder ending, a flatten) share one cancel
+        pos = self.bot.positions.get(sid)
+        if pos is None:
+            return None
+        task = pos.get("cancel")
+        if task is None or task.done() and (task.cancelled() or task.exception() or task.result() is None):
+            # First attempt, or the last one went unconfirmed: try again
+            task = pos["cancel"] = asyncio.ensure_future(self._cancel_entry(pos))
+        return await asyncio.shield(task)
+
+    async def _cancel_entry(self, pos):
+        name = pos["strategy"]["name"]
+        async with self._lock(pos["strategy"]["id"]):
+            order_id = pos["order_id"]
+            r = await pos["client"].cancel_order(order_id, pos["account"])
+        if r.status_code == 200:
+            self.bot.record_fill_event(CANCEL, pos["strategy"], order_id)
+        else:
+            self.bot.log(f"[{name}] Entry cancel failed: {r.status_code}, {r.text}")
+        status = await pos["client"].wait_for_final_status(order_id)
+        if status is None:
+            self.bot.log(f"[{name}] Entry {order_id} cancel not confirmed")
+            return None
+        self.bot.log(f"[{name}] Entry {order_id} {status.status}, {status.filled:g} filled")
+        return status
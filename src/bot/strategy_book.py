@@ -0,0 +1,102 @@
+import numpy as np
+from src.config.underlyings import UNDERLYINGS
+from src.utils.trading_calendar import expiry_index
+
+DAYS = {"Monday": 0, "Tuesday": 1, "Wednesday": 2, "Thursday": 3, "Friday": 4, "Saturday": 5, "Sunday": 6}
+
+
+def _minutes(hhmm):
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+
+def _codes(values):
+    labels, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    return [str(label) for label in labels], codes.astype(np.int32)
+
+
+class StrategyBook:
+    # Strategy parameters as columns, one row per strategy, so every check on
+    # a clock or market event is a single array expression over the book
+
+    def __init__(self, strategies, gateway_for=None):
+        self.strategies = list(strategies)
+        # Which gateway serves a strategy can depend on the accounts each one
+        # reports after login, so it is resolved when grouping, not up front
+        self.gateway_for = gateway_for or (lambda s: s.get("Gateway"))
+        self.index = {s["id"]: i for i, s in enumerate(self.strategies)}
+        self.day = np.array([DAYS[s["DayOfWeek"]] for s in self.strategies], dtype=np.int8)
+        self.t1 = np.array([_minutes(s["T1"]) for s in self.strategies], dtype=np.int16)
+        self.t2 = np.array([_minutes(s["T2"]) for s in self.strategies], dtype=np.int16)
+        self.delta = np.array([s["Delta"] / 100 for s in self.strategies], dtype=np.float64)
+        self.d1 = np.array([s["D1"] for s in self.strategies], dtype=np.int16)
+        self.d2 = np.array([s["D2"] for s in self.strategies], dtype=np.int16)
+        self.tp = np.array([s["TP"] / 100 for s in self.strategies], dtype=np.float64)
+        vix = [s.get("Vix") or (np.nan, np.nan) for s in self.strategies]
+        self.vix_lo = np.array([v[0] for v in vix], dtype=np.float64)
+        self.vix_hi = np.array([v[1] for v in vix], dtype=np.float64)
+        self.symbols, self.underlying = _codes([s.get("Underlying", "SPX") for s in self.strategies])
+
+    def __len__(self):
+        return len(self.strategies)
+
+    def due(self, now, minutes_ahead=0):
+        minute = now.hour * 60 + now.minute + minutes_ahead
+        return np.flatnonzero((self.day == now.weekday()) & (self.t1 == minute))
+
+    def exits(self, now, open_ids):
+        mask = np.zeros(len(self), dtype=bool)
+        mask[[self.index[sid] for sid in open_ids if sid in self.index]] = True
+        return np.flatnonzero(mask & (self.t2 == now.hour * 60 + now.minute))
+
+    def vix_gate(self, idx, vix):
+        # Strategies without a Vix range, or with no VIX reading, pass the gate
+        idx = np.asarray(idx, dtype=np.intp)
+        if vix is None:
+            return idx
+        lo, hi = self.vix_lo[idx], self.vix_hi[idx]
+        ok = np.isnan(lo) | ((vix >= lo) & (vix <= hi))
+        return idx[ok]
+
+    def tp_hits(self, ids, marks, entries):
+        idx = np.array([self.index[sid] for sid in ids], dtype=np.intp)
+        marks = np.asarray(marks, dtype=np.float64)
+        entries = np.asarray(entries, dtype=np.float64)
+        return marks >= entries * (1 + self.tp[idx])
+
+    def group(self, idx, today):
+        # Strategies that share a gateway, underlying and resolved expiries share chain data;
+        # each distinct (underlying, D1, D2) is resolved once
+        idx = np.asarray(idx, dtype=np.intp)
+        resolved = {}
+        groups = {}
+        for i in idx:
+            sym = self.symbols[self.underlying[i]]
+            rkey = (sym, int(self.d1[i]), int(self.d2[i]))
+            if rkey not in resolved:
+                schedule = UNDERLYINGS.get(sym, {}).get("expiries", "daily")
+                resolved[rkey] = expiry_index(schedule, today).resolve(today, rkey[1], rkey[2])
+            expiries = resolved[rkey]
+            if expiries is None:
+                continue
+            key = (self.gateway_for(self.strategies[i]), sym) + expiries
+            groups.setdefault(key, []).append(self.strategies[i])
+        return groups
+
+    def strategies_at(self, idx):
+        return [self.strategies[i] for i in idx]
+
+
+def select_by_delta(options, targets, price):
+    # One argmin over a (strategies x options) distance matrix picks every near leg at once
+    puts = [o for o in options if o.right == "P"]
+    if not puts:
+        return [None] * len(targets)
+    targets = np.asarray(targets, dtype=np.float64)
+    deltas = np.array([np.nan if o.delta is None else o.delta for o in puts], dtype=np.float64)
+    if np.isnan(deltas).all():
+        strikes = np.array([o.strike for o in puts], dtype=np.float64)
+        return [puts[int(np.abs(strikes - price).argmin())]] * len(targets)
+    diff = np.abs(deltas[None, :] - targets[:, None])
+    diff[:, np.isnan(deltas)] = np.inf
+    return [puts[i] for i in diff.argmin(axis=1)]
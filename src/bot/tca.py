@@ -0,0 +1,161 @@
+import argparse
+import glob
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+TCA_DIR = "tca"
+CAPACITY = 65536
+SUBMIT, MODIFY, FILL, CANCEL = 0, 1, 2, 3
+# What the order is for; only entries carry fills the analysis scores
+ENTRY, TP, CLOSE = 0, 1, 2
+
+EVENT_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("strategy", "S16"),
+    ("order_id", "S32"),
+    ("event", "u1"),
+    ("kind", "u1"),
+    # Order a cancel/replace took over from, empty otherwise
+    ("parent", "S32"),
+    ("qty", "<f8"),
+    ("limit", "<f8"),
+    ("fill", "<f8"),
+    ("near_bid", "<f8"),
+    ("near_ask", "<f8"),
+    ("near_last", "<f8"),
+    ("far_bid", "<f8"),
+    ("far_ask", "<f8"),
+    ("far_last", "<f8"),
+])
+
+
+def _num(value):
+    return np.nan if value is None else value
+
+
+class FillRecorder:
+    # Order events land in a memory-mapped ring; recording is a single row
+    # write with no I/O call, and flush() moves rows to the columnar store
+    # off the submission path.
+
+    def __init__(self, directory=TCA_DIR, capacity=CAPACITY):
+        self.directory = directory
+        self.capacity = capacity
+        os.makedirs(directory, exist_ok=True)
+        ring = os.path.join(directory, "ring.dat")
+        mode = "r+" if os.path.exists(ring) and os.path.getsize(ring) == capacity * EVENT_DTYPE.itemsize else "w+"
+        self.ring = np.memmap(ring, dtype=EVENT_DTYPE, mode=mode, shape=(capacity,))
+        # head counts every row ever written, flushed how many reached the store
+        self.cursor = np.memmap(os.path.join(directory, "ring.idx"), dtype="<i8",
+                                mode="r+" if mode == "r+" else "w+", shape=(2,))
+        self._lock = threading.Lock()
+
+    def record(self, event, strategy, order_id, qty=None, limit=None, fill=None, near=None, far=None,
+               kind=ENTRY, parent=None, ts=None):
+        with self._lock:
+            head = int(self.cursor[0])
+            row = self.ring[head % self.capacity:head % self.capacity + 1]
+            row["ts"] = time.time() if ts is None else ts
+            row["strategy"] = str(strategy).encode()[:16]
+            row["order_id"] = str(order_id).encode()[:32]
+            row["event"] = event
+            row["kind"] = kind
+            row["parent"] = str(parent or "").encode()[:32]
+            row["qty"], row["limit"], row["fill"] = _num(qty), _num(limit), _num(fill)
+            row["near_bid"], row["near_ask"], row["near_last"] = (
+                (_num(near.bid), _num(near.ask), _num(near.last)) if near is not None else (np.nan,) * 3
+            )
+            row["far_bid"], row["far_ask"], row["far_last"] = (
+                (_num(far.bid), _num(far.ask), _num(far.last)) if far is not None else (np.nan,) * 3
+            )
+            self.cursor[0] = head + 1
+
+    def flush(self):
+        with self._lock:
+            head, flushed = int(self.cursor[0]), int(self.cursor[1])
+            # Rows overwritten before a flush are gone; keep what the ring still holds
+            start = max(flushed, head - self.capacity)
+            if start >= head:
+                return None
+            idx = np.arange(start, head) % self.capacity
+            rows = self.ring[idx].copy()
+            self.cursor[1] = head
+        month = datetime.fromtimestamp(rows["ts"][0]).strftime("%Y-%m")
+        os.makedirs(os.path.join(self.directory, month), exist_ok=True)
+        # Named by first timestamp: a recreated ring restarts head at zero
+        path = os.path.join(self.directory, month, f"events-{int(rows['ts'][0] * 1000)}.npz")
+        np.savez(path, **{name: rows[name] for name in EVENT_DTYPE.names})
+        self.ring.flush()
+        self.cursor.flush()
+        return path
+
+
+def _column(part, name):
+    # Partitions written before a column existed read back with its zero value
+    if name in part.files:
+        return part[name]
+    return np.zeros(len(part["ts"]), dtype=EVENT_DTYPE[name])
+
+
+def load(directory=TCA_DIR, months=None):
+    files = sorted(glob.glob(os.path.join(directory, "*", "events-*.npz")))
+    if months:
+        files = [f for f in files if os.path.basename(os.path.dirname(f)) in months]
+    if not files:
+        return pd.DataFrame(columns=EVENT_DTYPE.names)
+    parts = [np.load(f) for f in files]
+    columns = {name: np.concatenate([_column(p, name) for p in parts]) for name in EVENT_DTYPE.names}
+    df = pd.DataFrame(columns)
+    for name in ("strategy", "order_id", "parent"):
+        df[name] = df[name].str.decode("utf-8")
+    return df
+
+
+def _roots(df):
+    # Follow cancel/replace links so every replacement maps to the order it started from
+    parents = dict(df.loc[df["parent"] != "", ["order_id", "parent"]].itertuples(index=False))
+    roots = {}
+    for order_id in df["order_id"].unique():
+        root, seen = order_id, set()
+        while root in parents and root not in seen:
+            seen.add(root)
+            root = parents[root]
+        roots[order_id] = root
+    return df["order_id"].map(roots)
+
+
+def analyze(df):
+    # Per entry: the original submit (with the quotes then) against the first
+    # fill of it or of any order that replaced it
+    df = df[df["kind"] == ENTRY].assign(order_id=lambda d: _roots(d))
+    submits = df[df["event"] == SUBMIT].groupby("order_id").first()
+    fills = df[df["event"] == FILL].groupby("order_id").first()
+    orders = submits.join(fills[["ts", "fill"]], rsuffix="_fill", lsuffix="_submit")
+    near_mid = (orders["near_bid"] + orders["near_ask"]) / 2
+    far_mid = (orders["far_bid"] + orders["far_ask"]) / 2
+    orders["mid"] = (far_mid - near_mid).abs()
+    orders["slippage"] = orders["fill_fill"] - orders["mid"]
+    orders["limit_slippage"] = orders["fill_fill"] - orders["limit"]
+    orders["time_to_fill"] = orders["ts_fill"] - orders["ts_submit"]
+    orders["filled"] = orders["ts_fill"].notna()
+    return orders.groupby("strategy").agg(
+        orders=("filled", "size"),
+        fill_rate=("filled", "mean"),
+        slippage_mean=("slippage", "mean"),
+        slippage_median=("slippage", "median"),
+        vs_limit_mean=("limit_slippage", "mean"),
+        time_to_fill_median=("time_to_fill", "median"),
+        time_to_fill_p90=("time_to_fill", lambda s: s.quantile(0.9)),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transaction-cost summary per strategy")
+    parser.add_argument("directory", nargs="?", default=TCA_DIR)
+    parser.add_argument("--month", action="append", help="YYYY-MM partition to include (default: all)")
+    args = parser.parse_args()
+    print(analyze(load(args.directory, args.month)).to_string())
@@ -1,108 +1,195 @@
 import asyncio
 import json
+import os
+import queue
+import threading
+import time
 import uuid
-import requests
-from datetime import datetime, timedelta
-from src.api.ibkr_client import IBKRClient
+from datetime import datetime
+import numpy as np
+from src.api.gateway import Gateway
+from src.api.ibkr_client import IBKRClient, STRIKE_WINDOW
+from src.api.quote_book import QuoteBook
+from src.bot.execution import MULTIPLIER, RepricingEngine, combo_prices, mid_price, price_cap
+from src.bot.strategy_book import StrategyBook, select_by_delta
+from src.bot.tca import CANCEL, CLOSE, ENTRY, FILL, SUBMIT, TP, FillRecorder
+from src.bot.workers import StrategyWorkerPool
+from src.config.gateways import GATEWAYS
 from src.config.strategies import STRATEGIES
+from src.config.underlyings import UNDERLYINGS
+from src.utils.diagnostics import LAG_THRESHOLD, PROFILE_DIR, LoopLagMonitor, SamplingProfiler, profile_key
 from src.utils.logging import logger
+from src.utils.trading_calendar import expiry_index
+
+MONITOR_INTERVAL = 1
+TCA_FLUSH_INTERVAL = 60
 
 class IBKRBot:
-    def __init__(self, gui_callback):
-        self.client = IBKRClient(gui_callback)
+    def __init__(self, gui_callback, gateways=GATEWAYS, snapshots=None, transport=None, workers=0):
+        self.clients = {
+            g["id"]: IBKRClient(
+                gui_callback,
+                Gateway(g["id"], g["url"], g.get("rate", 10), g.get("pool", 10), transport),
+                g.get("accounts"),
+                confirm=g.get("confirm"),
+            )
+            for g in gateways
+        }
+        self.clock = datetime.now
+        self.profiling = False
+        self.profiler = None
+        self.lag_threshold = LAG_THRESHOLD
+        # With workers > 0 this process only does I/O: quotes go to a shared
+        # memory book and strategy evaluation runs in a process pool
+        self.workers = workers
+        self.book = None
+        self.pool = None
+        self._pending = {}
+        self.fills = None
+        self.repricer = RepricingEngine(self)
+        self._fill_events = {}
+        self.client = next(iter(self.clients.values()))
+        self.strategy_book = StrategyBook(STRATEGIES, gateway_for=lambda s: self.client_for(s).gateway.id)
         self.running = False
         self.gui_callback = gui_callback
-        self.position_open = False
-        self.order_id = None
-        self.tp_order_id = None
-        self.current_strategy = None
-        self.manual_trigger = None
+        # Open calendars keyed by strategy id
+        self.positions = {}
+        self.loop = None
+        self._wake = None
+        self._tasks = set()
+        self._closing = set()
+        self._entering = set()
+        # Position snapshots for the GUI; the Tk thread drains it at its own pace
+        self.snapshots = snapshots if snapshots is not None else queue.Queue()
 
     def log(self, message):
         logger.info(message)
         self.gui_callback(message)
 
-    async def place_calendar_spread(self, near, far, qty, name):
+    @property
+    def position_open(self):
+        return bool(self.positions)
+
+    def client_for(self, strat):
+        if strat.get("Gateway") in self.clients:
+            return self.clients[strat["Gateway"]]
+        if strat.get("Account"):
+            for client in self.clients.values():
+                if client.serves(strat["Account"]):
+                    return client
+        return self.client
+
+    def account_for(self, strat, client):
+        return strat.get("Account") or client.account_id
+
+    def expiries_for(self, strat, today=None):
+        today = today or self.clock().date()
+        symbol = strat.get("Underlying", "SPX")
+        schedule = UNDERLYINGS.get(symbol, {}).get("expiries", "daily")
+        return expiry_index(schedule, today).resolve(today, strat["D1"], strat["D2"])
+
+    async def place_calendar_spread(self, near, far, qty, strat, price=None):
+        name = strat['name']
         try:
-            if not self.client.account_id:
+            client = self.client_for(strat)
+            account = self.account_for(strat, client)
+            if not account:
                 self.log(f"[{name}] No account ID")
                 return False
-            price = abs(near.get("last", 0) - far.get("last", 0)) or 0.1
+            if price is None:
+                mid, _ = combo_prices(near, far)
+                price = mid or abs(near.last - far.last) or 0.1
+            if price > price_cap(strat, qty):
+                self.log(f"[{name}] Price {price} exceeds MaxCost {strat['MaxCost']}")
+                return False
             order = {
-                "conid": int(near["conid"]),
+                "conid": near.conid,
                 "secType": "BAG",
                 "cOID": str(uuid.uuid4()),
                 "orderType": "LMT",
                 "side": "SELL",
                 "quantity": int(qty),
                 "legs": [
-                    {"conid": int(near["conid"]), "side": "SELL", "ratio": 1},
-                    {"conid": int(far["conid"]), "side": "BUY", "ratio": 1}
+                    {"conid": near.conid, "side": "SELL", "ratio": 1},
+                    {"conid": far.conid, "side": "BUY", "ratio": 1}
                 ],
                 "price": float(price),
                 "tif": "GTC"
             }
-            self.current_strategy = {**self.current_strategy, "near_conid": near["conid"], "far_conid": far["conid"]} if self.current_strategy else {"near_conid": near["conid"], "far_conid": far["conid"]}
-            self.log(f"[{name}] Placing spread: {json.dumps(order, indent=2)}")
-            if not await self.client.validate_order(order, name):
+            self.log(f"[{name}] Placing spread on {account}: {json.dumps(order, indent=2)}")
+            if not await client.validate_order(order, name, account):
                 return False
-            r = requests.post(f"{self.client.BASE_URL}/iserver/account/{self.client.account_id}/order", json=order, verify=False)
-            if r.status_code == 200:
-                response_data = r.json()
-                if isinstance(response_data, list) and len(response_data) > 0:
-                    self.order_id = response_data[0].get("order_id")
-                    self.log(f"[{name}] Spread placed {self.order_id}")
-                    return True
-                else:
-                    self.log(f"[{name}] Order failed: Unexpected response format {response_data}")
-                    return False
-            self.log(f"[{name}] Order failed: {r.status_code}, {r.text}")
-            return False
+            replies = await client.place_order(order, account)
+            if not replies or replies[0].order_id is None:
+                self.log(f"[{name}] Order rejected: {replies[0].message if replies else 'no reply'}")
+                return False
+            self.positions[strat['id']] = {
+                "strategy": strat,
+                "client": client,
+                "account": account,
+                "near_conid": near.conid,
+                "far_conid": far.conid,
+                "strike": near.strike,
+                "near_expiry": near.expiry,
+                "far_expiry": far.expiry,
+                "qty": int(qty),
+                "price": float(price),
+                "tp_price": None,
+                "filled": False,
+                "order_id": replies[0].order_id,
+                "order": order,
+                "tp_order_id": None,
+            }
+            self.record_fill_event(SUBMIT, strat, replies[0].order_id, qty, price, near, far)
+            self.log(f"[{name}] Spread placed {self.positions[strat['id']]['order_id']}")
+            return True
         except Exception as e:
             self.log(f"[{name}] Spread error: {e}")
             return False
 
-    async def place_take_profit(self, spread_price, qty, name):
+    async def place_take_profit(self, spread_price, qty, strat):
+        name = strat['name']
         try:
-            if not self.client.account_id:
+            pos = self.positions.get(strat['id'])
+            if not pos:
                 return False
-            tp = spread_price * (1 + self.current_strategy["TP"]/100)
+            tp = spread_price * (1 + strat["TP"]/100)
             order = {
-                "conid": int(self.current_strategy["near_conid"]),
+                "conid": int(pos["near_conid"]),
                 "secType": "BAG",
-                "cOID": str(uuid.uuid4()),
+                "cOID": f"{strat['id']}-{pos['order_id']}-tp",
                 "orderType": "LMT",
                 "side": "BUY",
                 "quantity": int(qty),
                 "legs": [
-                    {"conid": int(self.current_strategy["near_conid"]), "side": "BUY", "ratio": 1},
-                    {"conid": int(self.current_strategy["far_conid"]), "side": "SELL", "ratio": 1}
+                    {"conid": int(pos["near_conid"]), "side": "BUY", "ratio": 1},
+                    {"conid": int(pos["far_conid"]), "side": "SELL", "ratio": 1}
                 ],
                 "price": float(tp),
                 "tif": "GTC"
             }
             self.log(f"[{name}] Placing TP: {json.dumps(order, indent=2)}")
-            if not await self.client.validate_order(order, name):
+            client = pos["client"]
+            if not await client.validate_order(order, name, pos["account"]):
                 return False
-            r = requests.post(f"{self.client.BASE_URL}/iserver/account/{self.client.account_id}/order", json=order, verify=False)
-            if r.status_code == 200:
-                response_data = r.json()
-                if isinstance(response_data, list) and len(response_data) > 0:
-                    self.tp_order_id = response_data[0].get("order_id")
-                    self.log(f"[{name}] TP placed {self.tp_order_id}")
-                    return True
-                else:
-                    self.log(f"[{name}] TP failed: Unexpected response format {response_data}")
-                    return False
-            self.log(f"[{name}] TP failed: {r.status_code}, {r.text}")
-            return False
+            replies = await client.place_order(order, pos["account"])
+            if not replies or replies[0].order_id is None:
+                self.log(f"[{name}] TP rejected: {replies[0].message if replies else 'no reply'}")
+                return False
+            pos["tp_order_id"] = replies[0].order_id
+            pos["tp_price"] = float(tp)
+            self.record_fill_event(SUBMIT, strat, pos["tp_order_id"], qty, tp, kind=TP)
+            self.log(f"[{name}] TP placed {pos['tp_order_id']}")
+            return True
         except Exception as e:
             self.log(f"[{name}] TP error: {e}")
             return False
 
-    async def cancel_order(self, order_id, name):
+    async def cancel_order(self, order_id, strat):
+        name = strat['name']
         try:
-            r = requests.delete(f"{self.client.BASE_URL}/iserver/account/{self.client.account_id}/order/{order_id}", verify=False)
+            client = self.client_for(strat)
+            r = await client.cancel_order(order_id, self.account_for(strat, client))
             if r.status_code == 200:
                 self.log(f"[{name}] Order {order_id} canceled")
                 return True
@@ -113,92 +200,521 @@ class IBKRBot:
             self.log(f"[{name}] Cancel error: {e}")
             return False
 
-    async def close_position(self, name):
-        if not self.position_open:
-            return
+    def _close_order(self, sid, pos):
+        # Deterministic cOID: a retried flatten is rejected as a duplicate instead of doubling up
+        return {
+            "conid": int(pos["near_conid"]),
+            "secType": "BAG",
+            "cOID": f"{sid}-{pos['order_id']}-close",
+            "orderType": "MKT",
+            "side": "BUY",
+            "quantity": pos["qty"],
+            "legs": [
+                {"conid": int(pos["near_conid"]), "side": "BUY", "ratio": 1},
+                {"conid": int(pos["far_conid"]), "side": "SELL", "ratio": 1}
+            ],
+            "tif": "DAY"
+        }
+
+    async def _settle_entry(self, sid, pos):
+        # An entry still being worked is pulled first; only what actually
+        # filled is held and needs closing. Returns that quantity or None
+        if pos["filled"]:
+            return pos["qty"]
+        pos["flatten"] = True
+        status = await self.repricer.cancel_entry(sid)
+        if status is None:
+            return None
+        filled = int(status.filled)
+        if filled:
+            pos["qty"] = filled
+            pos["fill_price"] = status.avg_price
+        return filled
+
+    async def _prepare_close(self, sid, pos, results):
+        # "open" once the position can be closed with nothing resting behind
+        # it, "closed" when it is already flat, None when its state is unknown
+        qty = await self._settle_entry(sid, pos)
+        if qty is None:
+            return None
+        if qty == 0:
+            return "closed"
+        return await self._settle_tp(sid, pos, results)
+
+    async def _settle_tp(self, sid, pos, results):
+        # The close may only go out once the TP can no longer fill behind it.
+        # A 200 on the DELETE only means it was accepted, so wait for the TP's
+        # final status: "open" when it is cancelled (less whatever part of it
+        # filled), "closed" when it filled, None when its state is unknown
+        if pos["tp_order_id"] is None:
+            return "open"
+        name = pos["strategy"]["name"]
+        tp_id = pos["tp_order_id"]
         try:
-            ord_close = {
-                "conid": int(self.current_strategy["near_conid"]),
-                "secType": "BAG",
-                "cOID": str(uuid.uuid4()),
-                "orderType": "MKT",
-                "side": "BUY",
-                "quantity": 1,
-                "legs": [
-                    {"conid": int(self.current_strategy["near_conid"]), "side": "BUY", "ratio": 1},
-                    {"conid": int(self.current_strategy["far_conid"]), "side": "SELL", "ratio": 1}
-                ],
-                "tif": "DAY"
-            }
-            r = requests.post(f"{self.client.BASE_URL}/iserver/account/{self.client.account_id}/order", json=ord_close, verify=False)
+            r = await pos["client"].cancel_order(tp_id, pos["account"])
             if r.status_code == 200:
-                self.log(f"[{name}] Position closed")
-                self.position_open = False
-                self.order_id = None
-                self.tp_order_id = None
+                self.record_fill_event(CANCEL, pos["strategy"], tp_id, kind=TP)
             else:
-                self.log(f"[{name}] Close failed: {r.text}")
+                # Refused: most likely the TP already filled; its status tells
+                self.log(f"[{name}] TP cancel failed: {r.status_code}, {r.text}")
+            status = await pos["client"].wait_for_final_status(tp_id)
         except Exception as e:
-            self.log(f"[{name}] Close error: {e}")
+            results[sid]["cancel_tp"] = False
+            self.log(f"[{name}] TP cancel error: {e}")
+            return None
+        if status is None:
+            results[sid]["cancel_tp"] = False
+            self.log(f"[{name}] TP {tp_id} cancel not confirmed, not closing")
+            return None
+        results[sid]["cancel_tp"] = not status.is_filled
+        pos["tp_order_id"] = None
+        if status.is_filled or status.filled >= pos["qty"]:
+            self.log(f"[{name}] TP {tp_id} already filled")
+            return "closed"
+        if status.filled:
+            pos["qty"] -= int(status.filled)
+            self.log(f"[{name}] TP {tp_id} {status.status}, {status.filled:g} filled, {pos['qty']} left")
+        return "open"
+
+    async def _close(self, sid, pos, results):
+        name = pos["strategy"]["name"]
+        try:
+            replies = await pos["client"].place_order(self._close_order(sid, pos), pos["account"])
+        except Exception as e:
+            return self.log(f"[{name}] Close error: {e}")
+        if not replies or replies[0].order_id is None:
+            return self.log(f"[{name}] Close rejected: {replies[0].message if replies else 'no reply'}")
+        self.record_fill_event(SUBMIT, pos["strategy"], replies[0].order_id, pos["qty"], kind=CLOSE)
+        results[sid]["close"] = True
+
+    async def flatten(self, sids=None):
+        targets = {sid: pos for sid, pos in self.positions.items() if sids is None or sid in sids}
+        if not targets:
+            return {}
+        results = {sid: {"cancel_tp": None, "close": False} for sid in targets}
+        # Entry and TP cancels go out together, then every position with
+        # nothing left resting gets its own close order, all at once
+        states = await asyncio.gather(*(self._prepare_close(sid, pos, results) for sid, pos in targets.items()))
+        closes = []
+        for (sid, pos), state in zip(targets.items(), states):
+            if state == "closed":
+                results[sid]["close"] = True
+            elif state == "open":
+                closes.append(self._close(sid, pos, results))
+        await asyncio.gather(*closes)
+        for sid, result in results.items():
+            name = targets[sid]["strategy"]["name"]
+            if result["close"]:
+                self.positions.pop(sid, None)
+                self.log(f"[{name}] Position closed")
+            else:
+                self.log(f"[{name}] Position still open")
+        return results
+
+    async def flatten_all(self):
+        results = await self.flatten()
+        closed = sum(1 for r in results.values() if r["close"])
+        self.log(f"Flatten all: {closed}/{len(results)} positions closed")
+        return results
+
+    async def close_position(self, sid):
+        if sid in self.positions:
+            await self.flatten([sid])
+
+    def set_profiling(self, enabled):
+        self.profiling = enabled
+        if self.profiler is not None:
+            self.profiler.start() if enabled else self.profiler.stop()
+        self.log(f"Profiling {'enabled' if enabled else 'disabled'}")
+
+    async def _profiled(self, key, coro):
+        if not (self.profiling and self.profiler):
+            return await coro
+        self.profiler.begin(key)
+        token = profile_key.set(key)
+        try:
+            return await coro
+        finally:
+            profile_key.reset(token)
+            path = os.path.join(PROFILE_DIR, f"{key}-{self.clock():%Y%m%d-%H%M%S}.folded")
+            if self.profiler.end(key, path):
+                self.log(f"[{key}] Profile written to {path}")
 
     async def execute_strategy(self, strat):
-        if self.position_open:
-            self.log(f"[{strat['name']}] Position already open")
+        return await self._profiled(strat['id'], self.execute_group([strat]))
+
+    async def vix_level(self):
+        conid = await self.client.get_underlying_conid("VIX")
+        return await self.client.get_underlying_price(conid) if conid is not None else None
+
+    async def execute_due(self, idx):
+        book = self.strategy_book
+        if np.isfinite(book.vix_lo[idx]).any():
+            vix = await self.vix_level()
+            passed = book.vix_gate(idx, vix)
+            for strat in book.strategies_at(np.setdiff1d(idx, passed)):
+                self.log(f"[{strat['name']}] VIX {vix} outside {strat['Vix']}, skipping")
+            idx = passed
+        groups = book.group(idx, self.clock().date())
+        await asyncio.gather(*(
+            self._profiled("+".join(s['id'] for s in strats), self.execute_group(strats))
+            for strats in groups.values()
+        ))
+
+    async def execute_group(self, strats):
+        # A strategy is claimed before the first await, so an overlapping run
+        # (manual trigger, double click) cannot place a second entry for it
+        ready = []
+        for strat in strats:
+            if strat['id'] in self.positions:
+                self.log(f"[{strat['name']}] Position already open")
+            elif strat['id'] in self._entering or strat['id'] in self._pending:
+                self.log(f"[{strat['name']}] Entry already in progress")
+            else:
+                ready.append(strat)
+        if not ready:
+            return
+        ids = {s['id'] for s in ready}
+        self._entering.update(ids)
+        try:
+            await self._enter_group(ready)
+        finally:
+            self._entering.difference_update(ids)
+
+    async def _enter_group(self, ready):
+        # Strategies sharing a gateway, underlying and expiries: one chain
+        # fetch per distinct delta target, then every near leg in one pass
+        lead = ready[0]
+        names = ", ".join(s['name'] for s in ready)
+        client = self.client_for(lead)
+        if not client.authenticated:
+            return self.log(f"[{names}] Gateway {client.gateway.id} not authenticated")
+        symbol = lead.get("Underlying", "SPX")
+        self.log(f"[{names}] Executing {symbol} strategy on {client.gateway.id}")
+        expiries = self.expiries_for(lead)
+        if not expiries:
+            return self.log(f"[{names}] No listed expiries for D1={lead['D1']} D2={lead['D2']}")
+        near, far = expiries
+        window = max(s.get("StrikeWindow", STRIKE_WINDOW) for s in ready)
+        targets = sorted({s["Delta"] for s in ready})
+        chains = await asyncio.gather(*(
+            client.get_option_chain(symbol, near, window=window, target_delta=d) for d in targets
+        ))
+        chains = [c for c in chains if c]
+        if not chains:
+            return self.log(f"[{names}] Chain fetch failed")
+        chain1 = {"options": list({o.conid: o for c in chains for o in c["options"]}.values()),
+                  "price": chains[0]["price"]}
+        if self.pool is not None:
+            for strat in ready:
+                await self._submit_to_workers(client, strat, symbol, far, chain1)
             return
-        self.current_strategy = strat
-        self.log(f"[{strat['name']}] Executing strategy")
-        now = datetime.now()
-        near = now + timedelta(days=strat["D1"])
-        far = now + timedelta(days=strat["D2"])
-        chain1 = await self.client.get_option_chain("SPX", near)
-        chain2 = await self.client.get_option_chain("SPX", far)
-        if not chain1 or not chain2:
+        legs = select_by_delta(chain1["options"], [s["Delta"] / 100 for s in ready], chain1["price"])
+        await asyncio.gather(*(
+            self._enter_calendar(client, strat, symbol, far, opt_near) for strat, opt_near in zip(ready, legs)
+        ))
+
+    async def _enter_calendar(self, client, strat, symbol, far, opt_near):
+        if opt_near is None:
+            return self.log(f"[{strat['name']}] No suitable options")
+        self.log(f"[{strat['name']}] Selected option: conid={opt_near.conid} strike={opt_near.strike} expiry={opt_near.expiry}")
+        # The far leg must share the near strike, so resolve only that one
+        chain2 = await client.get_option_chain(symbol, far, window=0, center=opt_near.strike)
+        if not chain2:
             return self.log(f"[{strat['name']}] Chain fetch failed")
-        opt_near = await self.client.find_option(chain1, strat["Delta"])
-        opt_far = await self.client.find_option(chain2, strat["Delta"])
-        if opt_near is None or opt_far is None:
+        opt_far = await client.find_option(chain2, strat["Delta"], strike=opt_near.strike)
+        if opt_far is None:
             return self.log(f"[{strat['name']}] No suitable options")
-        if opt_near['strike'] != opt_far['strike']:
+        if opt_near.strike != opt_far.strike:
             return self.log(f"[{strat['name']}] Strike mismatch")
-        if opt_near['conid'] == opt_far['conid']:
+        if opt_near.conid == opt_far.conid:
             return self.log(f"[{strat['name']}] Same conid")
-        if await self.place_calendar_spread(opt_near, opt_far, 1, strat['name']):
-            self.position_open = True
-            await self.place_take_profit(abs(opt_near['last'] - opt_far['last']), 1, strat['name'])
+        await self.enter(opt_near, opt_far, 1, strat)
+
+    @staticmethod
+    def _mid(quote):
+        return mid_price(quote.bid, quote.ask, quote.last) if quote is not None else None
+
+    def _position_row(self, sid, pos, quotes, now):
+        near, far = self._mid(quotes.get(pos["near_conid"])), self._mid(quotes.get(pos["far_conid"]))
+        mark = far - near if near is not None and far is not None else None
+        entry = pos.get("fill_price") or pos["price"]
+        h, m = map(int, pos["strategy"]["T2"].split(":"))
+        left = int((now.replace(hour=h, minute=m, second=0, microsecond=0) - now).total_seconds())
+        return {
+            "id": sid,
+            "name": pos["strategy"]["name"],
+            "legs": f"P{pos['strike']:g} {pos['near_expiry'][4:]}/{pos['far_expiry'][4:]} x{pos['qty']}",
+            "mark": mark,
+            "pnl": (mark - entry) * pos["qty"] * MULTIPLIER if mark is not None else None,
+            "to_tp": pos["tp_price"] - mark if mark is not None and pos["tp_price"] is not None else None,
+            "to_t2": max(left, 0),
+        }
+
+    def record_fill_event(self, event, strat, order_id, qty=None, limit=None, near=None, far=None, fill=None,
+                          kind=ENTRY, parent=None, ts=None):
+        if self.fills is not None and order_id is not None:
+            self.fills.record(event, strat['id'], order_id, qty, limit, fill, near, far, kind, parent, ts)
+
+    async def wait_for_fill(self, order_id, timeout):
+        if any(p["order_id"] == order_id and p["filled"] for p in self.positions.values()):
+            return True
+        event = self._fill_events.setdefault(order_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def forget_fill_event(self, order_id):
+        self._fill_events.pop(order_id, None)
+
+    async def enter(self, near, far, qty, strat, price=None):
+        if not await self.place_calendar_spread(near, far, qty, strat, price):
+            return False
+        pos = self.positions[strat['id']]
+        _, far_side = combo_prices(near, far)
+        fill = await self.repricer.work(strat['id'], pos["price"], far_side or pos["price"])
+        self.forget_fill_event(pos["order_id"])
+        if fill is None:
+            return False
+        # A partial fill before the entry was pulled leaves less than qty held
+        await self.place_take_profit(fill, pos["qty"], strat)
+        return True
+
+    async def check_fills(self, quotes):
+        unfilled = [(sid, pos) for sid, pos in self.positions.items() if not pos["filled"] and pos["order_id"]]
+        statuses = await asyncio.gather(
+            *(pos["client"].get_order_status(pos["order_id"]) for _, pos in unfilled), return_exceptions=True
+        )
+        filled = []
+        for (sid, pos), status in zip(unfilled, statuses):
+            if isinstance(status, Exception):
+                self.log(f"[{pos['strategy']['name']}] Order status failed: {status}")
+            elif status is not None and status.is_filled:
+                pos["filled"] = True
+                pos["fill_price"] = status.avg_price
+                if pos["order_id"] in self._fill_events:
+                    self._fill_events[pos["order_id"]].set()
+                self.log(f"[{pos['strategy']['name']}] Entry filled at {status.avg_price}")
+                filled.append((pos, pos["order_id"], status))
+        if not filled or self.fills is None:
+            return
+        # TCA wants when the gateway executed the fill, not when this poll saw it
+        times = await asyncio.gather(
+            *(pos["client"].execution_time(order_id, pos["order"].get("cOID")) for pos, order_id, _ in filled),
+            return_exceptions=True,
+        )
+        for (pos, order_id, status), ts in zip(filled, times):
+            self.record_fill_event(
+                FILL, pos["strategy"], order_id, status.filled, pos["price"],
+                quotes.get(pos["near_conid"]), quotes.get(pos["far_conid"]), status.avg_price,
+                ts=ts if isinstance(ts, float) else None,
+            )
+
+    async def monitor_positions(self):
+        flushed = time.monotonic()
+        while True:
+            try:
+                by_client = {}
+                for pos in self.positions.values():
+                    by_client.setdefault(pos["client"], set()).update((pos["near_conid"], pos["far_conid"]))
+                if self.book is not None:
+                    self.book.pinned = set().union(*by_client.values())
+                # One gateway failing (timeout, open circuit) must not blank the others
+                results = await asyncio.gather(
+                    *(c.get_snapshot(list(ids)) for c, ids in by_client.items()), return_exceptions=True
+                )
+                quotes = {}
+                for client, r in zip(by_client, results):
+                    if isinstance(r, Exception):
+                        self.log(f"[{client.gateway.id}] Position quotes failed: {r}")
+                    else:
+                        quotes.update(r)
+                await self.check_fills(quotes)
+                if self.fills is not None and time.monotonic() - flushed > TCA_FLUSH_INTERVAL:
+                    flushed = time.monotonic()
+                    await asyncio.to_thread(self.fills.flush)
+                now = self.clock()
+                rows = [self._position_row(sid, pos, quotes, now) for sid, pos in list(self.positions.items())]
+                self.snapshots.put(rows)
+                self.check_take_profits(rows)
+            except Exception as e:
+                self.log(f"Position monitor error: {e}")
+            await asyncio.sleep(MONITOR_INTERVAL)
+
+    def check_take_profits(self, rows):
+        # Safety net for filled positions whose TP order never made it to the
+        # gateway: test every mark against its TP level in one pass
+        live = [
+            (r["id"], r["mark"], pos.get("fill_price") or pos["price"]) for r in rows
+            if r["mark"] is not None and r["id"] in self.strategy_book.index and r["id"] not in self._closing
+            and (pos := self.positions.get(r["id"])) and pos["filled"] and pos["tp_order_id"] is None
+        ]
+        if not live:
+            return
+        ids, marks, entries = zip(*live)
+        hits = [sid for sid, hit in zip(ids, self.strategy_book.tp_hits(ids, marks, entries)) if hit]
+        if hits:
+            self.log(f"Take profit reached without a resting order: {', '.join(hits)}")
+            self.spawn(self._close_once(hits))
+
+    async def _submit_to_workers(self, client, strat, symbol, far, chain1):
+        # Far candidates cover the same strikes as the near window; the worker pairs them up
+        strikes = sorted({o.strike for o in chain1["options"]})
+        chain2 = await client.get_option_chain(symbol, far, window=len(strikes) // 2 + 1, center=strikes[len(strikes) // 2])
+        if not chain2:
+            return self.log(f"[{strat['name']}] Chain fetch failed")
+        options = {o.conid: o for o in chain1["options"] + chain2["options"]}
+        self._pending[strat['id']] = (strat, options)
+        self.pool.submit(
+            strat, [(o.conid, o.strike) for o in chain1["options"]], [(o.conid, o.strike) for o in chain2["options"]]
+        )
+        self.log(f"[{strat['name']}] Submitted to strategy workers")
+
+    async def consume_intents(self):
+        while True:
+            intent = await asyncio.to_thread(self.pool.next_intent, 0.5)
+            if intent is None:
+                continue
+            pending = self._pending.pop(intent["id"], None)
+            if pending is None:
+                continue
+            strat, options = pending
+            if "error" in intent:
+                self.log(f"[{strat['name']}] {intent['error']}")
+                continue
+            near, far = options[intent["near"]], options[intent["far"]]
+            # Each entry works its own repricing ladder; the next intent must not wait for it
+            self._entering.add(strat['id'])
+            task = self.spawn(self.enter(near, far, intent["qty"], strat, price=intent["price"]))
+            task.add_done_callback(lambda _, sid=strat['id']: self._entering.discard(sid))
+
+    def start_workers(self):
+        self.book = QuoteBook()
+        self.pool = StrategyWorkerPool(self.book, self.workers)
+        self.pool.start()
+        for c in self.clients.values():
+            c.quote_sink = self.book.publish_quotes
+        self.log(f"Started {len(self.pool.processes)} strategy workers")
+        return asyncio.create_task(self.consume_intents())
+
+    def stop_workers(self, consumer):
+        consumer.cancel()
+        for c in self.clients.values():
+            c.quote_sink = None
+        self.pool.stop()
+        self.book.close()
+        self.pool = self.book = None
+
+    async def prefetch(self, strats):
+        # Strategies sharing an underlying and expiry share one set of requests;
+        # different underlyings are fetched side by side
+        jobs = {}
+        for strat in strats:
+            client = self.client_for(strat)
+            symbol = strat.get("Underlying", "SPX")
+            window = strat.get("StrikeWindow", STRIKE_WINDOW)
+            for exp in self.expiries_for(strat) or ():
+                key = (client.gateway.id, symbol, exp, window)
+                if key not in jobs:
+                    jobs[key] = client.prefetch_chain(symbol, exp, window)
+        await asyncio.gather(*jobs.values())
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def command(self, fn, *args):
+        # Entry point for other threads (the GUI): schedules fn(*args) on the
+        # bot loop right away and returns a concurrent.futures.Future
+        if self.loop is None or not self.running:
+            raise RuntimeError("Bot is not running")
+        return asyncio.run_coroutine_threadsafe(fn(*args), self.loop)
+
+    async def _close_once(self, sids):
+        self._closing.update(sids)
+        try:
+            await self.flatten(sids)
+        finally:
+            self._closing.difference_update(sids)
 
     async def run(self):
-        if not self.client.authenticated:
-            if not await self.client.authenticate():
-                self.log("Auth failed, stopping")
-                return
+        clients = list(self.clients.values())
+        await asyncio.gather(*(c.authenticate() for c in clients if not c.authenticated))
+        if not any(c.authenticated for c in clients):
+            self.log("Auth failed, stopping")
+            for c in clients:
+                c.gateway.close()
+            return
+        for c in clients:
+            if c.authenticated:
+                c.gateway.start_keepalive(self.log)
+        self.loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
         self.running = True
         self.log("Bot started")
-        while self.running:
-            now = datetime.now()
-            day = now.strftime("%A")
-            tm = now.strftime("%H:%M")
-            if self.manual_trigger:
-                await self.execute_strategy(self.manual_trigger)
-                self.manual_trigger = None
-                await asyncio.sleep(60)
-                continue
-            for strat in STRATEGIES:
-                if day == strat['DayOfWeek'] and tm == strat['T1']:
-                    await self.execute_strategy(strat)
-                    await asyncio.sleep(60)
-                    break
-            if self.position_open and self.current_strategy and tm == self.current_strategy['T2']:
-                await self.close_position(self.current_strategy['name'])
-            await asyncio.sleep(1)
+        prefetched = None
+        fired = set()
+        book = self.strategy_book
+        self.fills = FillRecorder()
+        monitor = asyncio.create_task(self.monitor_positions())
+        lag_monitor = LoopLagMonitor(threading.get_ident(), self.log, self.lag_threshold)
+        lag_monitor.start()
+        self.profiler = SamplingProfiler(threading.get_ident(), self.loop)
+        if self.profiling:
+            self.profiler.start()
+        consumer = self.start_workers() if self.workers else None
+        try:
+            while self.running:
+                now = self.clock()
+                tm = now.strftime("%H:%M")
+                open_ids = [sid for sid in self.positions if sid not in self._closing]
+                exits = [book.strategies[i]['id'] for i in book.exits(now, open_ids)]
+                if exits:
+                    self.spawn(self._close_once(exits))
+                soon = book.due(now, minutes_ahead=1)
+                if soon.size and prefetched != (now.date(), tm):
+                    prefetched = (now.date(), tm)
+                    self.spawn(self.prefetch(book.strategies_at(soon)))
+                # Each entry fires once per scheduled minute and runs in the
+                # background, so exits and commands are never held up by it
+                fired = {k for k in fired if k[1:] == (now.date(), tm)}
+                due = [i for i in book.due(now) if (book.strategies[i]['id'], now.date(), tm) not in fired]
+                if due:
+                    fired.update((book.strategies[i]['id'], now.date(), tm) for i in due)
+                    self.spawn(self.execute_due(np.array(due, dtype=np.intp)))
+                try:
+                    await asyncio.wait_for(self._wake.wait(), 1 - now.microsecond / 1e6)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        finally:
+            monitor.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            lag_monitor.stop()
+            self.profiler.stop()
+            if consumer is not None:
+                self.stop_workers(consumer)
+            self.fills.flush()
+            # A restart builds a new bot, so release this one's sessions and executors
+            for c in clients:
+                c.gateway.close()
+            self.loop = None
 
     def stop(self):
         self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._wake.set)
         self.log("Bot stopped")
 
     def trigger_strategy(self, sid):
         strat = next((s for s in STRATEGIES if s['id'] == sid), None)
         if strat:
-            self.manual_trigger = strat
             self.log(f"Manually triggered {strat['name']}")
-        else:
-            self.log(f"Strategy {sid} not found")
\ No newline at end of file
+            return self.command(self.execute_strategy, strat)
+        self.log(f"Strategy {sid} not found")
+        return None
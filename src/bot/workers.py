@@ -0,0 +1,79 @@
+import math
+import multiprocessing as mp
+import os
+import queue
+from src.api.quote_book import QuoteBook
+from src.bot.execution import MULTIPLIER, mid_price
+
+
+def evaluate(book, strat, near_legs, far_legs, qty=1):
+    # Legs are (conid, strike) pairs; quotes come straight from the shared book
+    target = strat["Delta"] / 100
+    best = None
+    for conid, strike in near_legs:
+        quote = book.read(conid)
+        if quote is None or math.isnan(quote[3]):
+            continue
+        diff = abs(abs(quote[3]) - target)
+        if best is None or diff < best[0]:
+            best = (diff, conid, strike, quote)
+    if best is None:
+        return None
+    _, near_conid, strike, near_quote = best
+    far_conid = next((c for c, k in far_legs if k == strike and c != near_conid), None)
+    far_quote = book.read(far_conid) if far_conid is not None else None
+    if far_quote is None:
+        return None
+    price = abs(mid_price(*near_quote[:3]) - mid_price(*far_quote[:3]))
+    if math.isnan(price) or price * MULTIPLIER * qty > strat["MaxCost"]:
+        return None
+    return {"id": strat["id"], "near": near_conid, "far": far_conid, "strike": strike,
+            "price": round(price or 0.1, 2), "qty": qty}
+
+
+def _worker_main(book_name, capacity, tasks, intents):
+    book = QuoteBook(book_name, capacity)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            strat, near_legs, far_legs = task
+            try:
+                intent = evaluate(book, strat, near_legs, far_legs)
+            except Exception as e:
+                intent = {"id": strat["id"], "error": str(e)}
+            intents.put(intent or {"id": strat["id"], "error": "No suitable options"})
+    finally:
+        book.close()
+
+
+class StrategyWorkerPool:
+    def __init__(self, book, processes=None):
+        ctx = mp.get_context("spawn")
+        self.tasks = ctx.Queue()
+        self.intents = ctx.Queue()
+        self.processes = [
+            ctx.Process(target=_worker_main, args=(book.name, book.capacity, self.tasks, self.intents),
+                        name=f"strategy-worker-{i}", daemon=True)
+            for i in range(processes or os.cpu_count() or 1)
+        ]
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+
+    def submit(self, strat, near_legs, far_legs):
+        self.tasks.put((strat, near_legs, far_legs))
+
+    def next_intent(self, timeout=None):
+        try:
+            return self.intents.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def stop(self):
+        for _ in self.processes:
+            self.tasks.put(None)
+        for p in self.processes:
+            p.join(timeout=2)
@@ -0,0 +1,16 @@
+# Each gateway gets its own connection pool, rate limiter and keep-alive.
+# "accounts" lists the accounts served through it; the first one is the
+# default for strategies that do not set "Account". Leave it empty to use
+# the first account the gateway reports. "confirm" lists the order warning
+# message ids (e.g. "o354") the bot may answer yes to; every other warning
+# prompt is declined and the order treated as rejected.
+GATEWAYS = [
+    {
+        "id": "main",
+        "url": "https://localhost:5000/v1/api",
+        "accounts": [],
+        "confirm": [],
+        "rate": 10,
+        "pool": 10,
+    },
+]
@@ -2,14 +2,20 @@ STRATEGIES = [
     {
         "id": "1",
         "name": "Monday SPX Calendar",
+        "Gateway": "main",
+        "Account": None,
+        "Underlying": "SPX",
         "DayOfWeek": "Monday",
         "Delta": 70,
+        "StrikeWindow": 5,
         "D1": 4,
         "D2": 6,
         "T1": "09:32",
         "T2": "15:30",
         "TP": 20,
         "MaxCost": 10000,
+        "RepriceSeconds": 5,
+        "RepriceSteps": 5,
         "Vix": [10, 30],
         "VixOvernightRange": [-5, 5],
         "VixIntradayRange": [-3, 3],
@@ -20,14 +26,20 @@ STRATEGIES = [
     {
         "id": "2",
         "name": "Wednesday SPX Calendar",
+        "Gateway": "main",
+        "Account": None,
+        "Underlying": "SPX",
         "DayOfWeek": "Wednesday",
         "Delta": 65,
+        "StrikeWindow": 5,
         "D1": 2,
         "D2": 7,
         "T1": "10:00",
         "T2": "15:00",
         "TP": 15,
         "MaxCost": 8000,
+        "RepriceSeconds": 5,
+        "RepriceSteps": 5,
         "Vix": [12, 28],
         "VixOvernightRange": [-4, 4],
         "VixIntradayRange": [-2, 2],
@@ -38,14 +50,20 @@ STRATEGIES = [
     {
         "id": "3",
         "name": "Saturday Test",
+        "Gateway": "main",
+        "Account": None,
+        "Underlying": "SPX",
         "DayOfWeek": "Saturday",
         "Delta": 70,
+        "StrikeWindow": 5,
         "D1": 4,
         "D2": 6,
         "T1": "13:00",
         "T2": "15:30",
         "TP": 20,
         "MaxCost": 10000,
+        "RepriceSeconds": 5,
+        "RepriceSteps": 5,
         "Vix": [10, 30],
         "VixOvernightRange": [-5, 5],
         "VixIntradayRange": [-3, 3],
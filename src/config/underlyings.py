@@ -0,0 +1,14 @@
+# Option underlyings the bot can trade. "exchange" picks the listing out of
+# the /iserver/secdef/search results; "expiries" is the listing schedule
+# used to map D1/D2 onto real expiries (see src/utils/trading_calendar.py).
+UNDERLYINGS = {
+    "SPX": {"secType": "IND", "exchange": "CBOE", "expiries": "daily"},
+    "XSP": {"secType": "IND", "exchange": "CBOE", "expiries": "daily"},
+    "NDX": {"secType": "IND", "exchange": "NASDAQ", "expiries": "daily"},
+    "RUT": {"secType": "IND", "exchange": "RUSSELL", "expiries": "daily"},
+    "SPY": {"secType": "STK", "exchange": "ARCA", "expiries": "daily"},
+    "QQQ": {"secType": "STK", "exchange": "NASDAQ", "expiries": "daily"},
+    "IWM": {"secType": "STK", "exchange": "ARCA", "expiries": "daily"},
+    # Not traded: read for the per-strategy "Vix" entry gate
+    "VIX": {"secType": "IND", "exchange": "CBOE"},
+}
@@ -7,17 +7,32 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 import asyncio
+import queue
 import threading
 from src.bot.trading_bot import IBKRBot
 from src.config.strategies import STRATEGIES
 
+# Cap the positions panel at 5 redraws per second whatever the quote rate
+FRAME_MS = 200
+# Results and log lines from the bot thread are applied on the Tk thread at this cadence
+INBOX_MS = 20
+POSITION_COLUMNS = ("name", "legs", "mark", "pnl", "to_tp", "to_t2")
+POSITION_HEADINGS = ("Strategy", "Legs", "Mark", "PnL", "To TP", "To T2")
+
 class TradingGUI:
-    def __init__(self, root):
+    def __init__(self, root, transport=None, profile=False, lag_threshold=None, workers=0):
         try:
             print("Initializing TradingGUI")
             self.root = root
+            self.tk_thread = threading.get_ident()
+            self.inbox = queue.Queue()
+            self.transport = transport
+            self.lag_threshold = lag_threshold
+            self.workers = workers
             self.root.title("IBKR Trading Bot")
             self.bot = None
+            self.snapshots = queue.Queue()
+            self.position_cells = {}
             print("Creating frame")
             frame = ttk.Frame(self.root, padding="10")
             frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -33,6 +48,7 @@ class TradingGUI:
             combo['values'] = [s['name'] for s in STRATEGIES]
             print(f"Combobox values: {combo['values']}")
             combo.grid(row=1, column=1, pady=5)
+            combo.bind("<<ComboboxSelected>>", lambda e: self.update_strategy_details())
             if STRATEGIES:
                 combo.current(0)
                 print("Set default strategy")
@@ -52,13 +68,28 @@ class TradingGUI:
             ttk.Button(frame, text="Start Bot", command=self.start_bot).grid(row=4, column=0, pady=5)
             ttk.Button(frame, text="Stop Bot", command=self.stop_bot).grid(row=4, column=1, pady=5)
             ttk.Button(frame, text="Start Selected Strategy", command=self.start_selected_strategy).grid(row=4, column=2, pady=5)
-            ttk.Button(frame, text="Close Position", command=self.close_position).grid(row=5, column=0, columnspan=3, pady=5)
+            ttk.Button(frame, text="Close Position", command=self.close_position).grid(row=5, column=0, pady=5)
+            ttk.Button(frame, text="Flatten All", command=self.flatten_all).grid(row=5, column=1, pady=5)
+            self.profile_var = tk.BooleanVar(value=profile)
+            ttk.Checkbutton(frame, text="Profile executions", variable=self.profile_var,
+                            command=self.toggle_profiling).grid(row=5, column=2, pady=5)
+            print("Creating positions panel")
+            self.positions_tree = ttk.Treeview(frame, columns=POSITION_COLUMNS, show="headings", height=6)
+            for col, heading in zip(POSITION_COLUMNS, POSITION_HEADINGS):
+                self.positions_tree.heading(col, text=heading)
+                self.positions_tree.column(col, width=140 if col in ("name", "legs") else 70, anchor=tk.E)
+            self.positions_tree.grid(row=6, column=0, columnspan=3, pady=5)
+            self.root.after(FRAME_MS, self.refresh_positions)
+            self.root.after(INBOX_MS, self.pump_inbox)
             print("TradingGUI initialization complete")
         except Exception as e:
             print(f"Error in TradingGUI.__init__: {e}")
             self.log(f"Error initializing GUI: {e}")
 
     def log(self, msg):
+        if threading.get_ident() != self.tk_thread:
+            self.inbox.put((self.log, (msg,)))
+            return
         try:
             self.log_text.configure(state="normal")
             self.log_text.insert(tk.END, f"{msg}\n")
@@ -66,6 +97,31 @@ class TradingGUI:
         except Exception as e:
             print(f"Error in log: {e}")
 
+    def pump_inbox(self):
+        try:
+            while True:
+                try:
+                    fn, args = self.inbox.get_nowait()
+                except queue.Empty:
+                    break
+                fn(*args)
+        except Exception as e:
+            print(f"Error in pump_inbox: {e}")
+        finally:
+            self.root.after(INBOX_MS, self.pump_inbox)
+
+    def on_result(self, future, label, describe=None):
+        # The future completes on the bot thread; hand the outcome to Tk
+        future.add_done_callback(lambda f: self.inbox.put((self.report, (f, label, describe))))
+
+    def report(self, future, label, describe):
+        if future.cancelled():
+            self.log(f"{label} cancelled")
+        elif future.exception() is not None:
+            self.log(f"{label} failed: {future.exception()}")
+        else:
+            self.log(describe(future.result()) if describe else f"{label} done")
+
     def copy_log(self, event=None):
         try:
             txt = self.log_text.selection_get()
@@ -98,15 +154,70 @@ class TradingGUI:
         except Exception as e:
             print(f"Error in update_strategy_details: {e}")
 
+    @staticmethod
+    def format_cell(col, value):
+        if value is None:
+            return "-"
+        if col == "to_t2":
+            return f"{value // 3600}:{value % 3600 // 60:02d}:{value % 60:02d}"
+        if col in ("mark", "pnl", "to_tp"):
+            return f"{value:,.2f}"
+        return str(value)
+
+    def refresh_positions(self):
+        try:
+            # Only the newest snapshot matters; older ones are dropped unseen
+            latest = None
+            while True:
+                try:
+                    latest = self.snapshots.get_nowait()
+                except queue.Empty:
+                    break
+            if latest is not None:
+                self.render_positions(latest)
+        except Exception as e:
+            print(f"Error in refresh_positions: {e}")
+        finally:
+            self.root.after(FRAME_MS, self.refresh_positions)
+
+    def render_positions(self, rows):
+        seen = set()
+        for row in rows:
+            iid = row["id"]
+            seen.add(iid)
+            values = tuple(self.format_cell(col, row[col]) for col in POSITION_COLUMNS)
+            old = self.position_cells.get(iid)
+            if old is None:
+                self.positions_tree.insert("", tk.END, iid=iid, values=values)
+            else:
+                for col, new, prev in zip(POSITION_COLUMNS, values, old):
+                    if new != prev:
+                        self.positions_tree.set(iid, col, new)
+            self.position_cells[iid] = values
+        for iid in set(self.position_cells) - seen:
+            self.positions_tree.delete(iid)
+            del self.position_cells[iid]
+
     def start_bot(self):
         try:
             if not self.bot or not self.bot.running:
-                self.bot = IBKRBot(self.log)
+                self.bot = IBKRBot(self.log, snapshots=self.snapshots, transport=self.transport,
+                                   workers=self.workers)
+                self.bot.profiling = self.profile_var.get()
+                if self.lag_threshold:
+                    self.bot.lag_threshold = self.lag_threshold
                 self.status_var.set("Bot Status: Running")
                 threading.Thread(target=lambda: asyncio.run(self.bot.run()), daemon=True).start()
         except Exception as e:
             self.log(f"Error in start_bot: {e}")
 
+    def toggle_profiling(self):
+        try:
+            if self.bot:
+                self.bot.set_profiling(self.profile_var.get())
+        except Exception as e:
+            self.log(f"Error in toggle_profiling: {e}")
+
     def stop_bot(self):
         try:
             if self.bot and self.bot.running:
@@ -123,7 +234,9 @@ class TradingGUI:
             name = self.strategy_var.get()
             strat = next((s for s in STRATEGIES if s['name'] == name), None)
             if strat:
-                self.bot.trigger_strategy(strat['id'])
+                future = self.bot.trigger_strategy(strat['id'])
+                if future:
+                    self.on_result(future, f"{strat['name']} execution")
             else:
                 self.log("No strategy selected")
         except Exception as e:
@@ -131,8 +244,23 @@ class TradingGUI:
 
     def close_position(self):
         try:
-            if self.bot and self.bot.position_open:
-                asyncio.run_coroutine_threadsafe(self.bot.close_position(self.bot.current_strategy['name']),
-                                                asyncio.get_event_loop())
+            name = self.strategy_var.get()
+            strat = next((s for s in STRATEGIES if s['name'] == name), None)
+            if self.bot and self.bot.running and strat and strat['id'] in self.bot.positions:
+                self.on_result(self.bot.command(self.bot.close_position, strat['id']), f"Close {strat['name']}")
+            else:
+                self.log("No open position for selected strategy")
+        except Exception as e:
+            self.log(f"Error in close_position: {e}")
+
+    def flatten_all(self):
+        try:
+            if not self.bot or not self.bot.running:
+                self.log("Start bot first")
+                return
+            self.on_result(
+                self.bot.command(self.bot.flatten_all), "Flatten all",
+                lambda results: f"Flatten all: {sum(1 for r in results.values() if r['close'])}/{len(results)} closed",
+            )
         except Exception as e:
-            self.log(f"Error in close_position: {e}")
\ No newline at end of file
+            self.log(f"Error in flatten_all: {e}")
\ No newline at end of file
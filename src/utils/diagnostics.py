@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import inspect
+import os
+import sys
+import threading
+import time
+import traceback
+import weakref
+from collections import Counter
+
+LAG_THRESHOLD = 0.1
+PROFILE_INTERVAL = 0.005
+PROFILE_DIR = "profiles"
+
+# Session key of the profiled execution; tasks it spawns inherit it
+profile_key = contextvars.ContextVar("profile_key", default=None)
+
+
+def _coroutine_name(frame):
+    # Innermost coroutine on the stack is the one that is holding the loop
+    while frame is not None:
+        if frame.f_code.co_flags & inspect.CO_COROUTINE:
+            return frame.f_code.co_qualname
+        frame = frame.f_back
+    return "<callback>"
+
+
+class LoopLagMonitor:
+    def __init__(self, thread_id, log, threshold=LAG_THRESHOLD):
+        self.thread_id = thread_id
+        self.log = log
+        self.threshold = threshold
+        self.interval = threshold / 4
+        self.last_beat = time.monotonic()
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+        self._reported = False
+
+    def start(self):
+        self._task = asyncio.create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_beat = now
+            lag = now - expected
+            if lag > self.threshold:
+                self.log(f"Event loop lag: blocked for {lag * 1000:.0f} ms")
+            self._reported = False
+
+    def _watch(self):
+        # Runs off-loop so it can catch the stall while it is still happening
+        while not self._stopped.wait(self.interval):
+            stalled = time.monotonic() - self.last_beat
+            if stalled <= self.threshold + self.interval or self._reported:
+                continue
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self._reported = True
+            stack = "".join(traceback.format_stack(frame))
+            self.log(f"Event loop blocked {stalled * 1000:.0f} ms in {_coroutine_name(frame)}:\n{stack}")
+
+
+class SamplingProfiler:
+    # Samples go to the session of the task running on the loop when they are
+    # taken. The sampler thread cannot read a task's context, so a task
+    # factory notes each new task's profile_key as it is created.
+
+    def __init__(self, thread_id, loop=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.loop = loop
+        self.interval = interval
+        self.sessions = {}
+        self._task_keys = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        if loop is not None:
+            self._factory = loop.get_task_factory()
+            loop.set_task_factory(self._create_task)
+
+    def _create_task(self, loop, coro, **kwargs):
+        if self._factory is not None:
+            task = self._factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        key = context.get(profile_key) if context is not None else profile_key.get()
+        if key is not None:
+            self._task_keys[task] = key
+        return task
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def begin(self, key):
+        # Called from the task that runs the execution; the caller sets
+        # profile_key so the tasks it spawns are tracked too
+        with self._lock:
+            self.sessions[key] = Counter()
+        self._task_keys[asyncio.current_task()] = key
+
+    def end(self, key, path):
+        task = asyncio.current_task()
+        if self._task_keys.get(task) == key:
+            del self._task_keys[task]
+        with self._lock:
+            samples = self.sessions.pop(key, None)
+        if not samples:
+            return None
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Folded stacks, one "root;...;leaf count" per line, as flamegraph.pl and speedscope read them
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            task = asyncio.current_task(self.loop) if self.loop is not None else None
+            key = self._task_keys.get(task) if task is not None else None
+            if key is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            with self._lock:
+                samples = self.sessions.get(key)
+                if samples is not None:
+                    samples[";".join(reversed(names))] += 1
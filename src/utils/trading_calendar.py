@@ -0,0 +1,110 @@
+import bisect
+from array import array
+from datetime import date, timedelta
+from functools import lru_cache
+
+
+def _observed(d):
+    if d.weekday() == 5:
+        return d - timedelta(days=1)
+    if d.weekday() == 6:
+        return d + timedelta(days=1)
+    return d
+
+
+def _nth_weekday(year, month, weekday, n):
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _easter(year):
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+@lru_cache(maxsize=None)
+def holidays(year):
+    days = {
+        _nth_weekday(year, 1, 0, 3),           # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),           # Washington's Birthday
+        _easter(year) - timedelta(days=2),     # Good Friday
+        _nth_weekday(year, 5, 0, -1),          # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),           # Labor Day
+        _nth_weekday(year, 11, 3, 4),          # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    # A Saturday New Year is not observed on the prior Friday
+    new_year = date(year, 1, 1)
+    if new_year.weekday() != 5:
+        days.add(_observed(new_year))
+    if year >= 2022:
+        days.add(_observed(date(year, 6, 19)))
+    return frozenset(days)
+
+
+class TradingCalendar:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        closed = frozenset().union(*(holidays(y) for y in range(start.year, end.year + 1)))
+        self.sessions = array("l", (
+            d.toordinal() for d in (start + timedelta(days=i) for i in range((end - start).days + 1))
+            if d.weekday() < 5 and d not in closed
+        ))
+
+
+
+class ExpiryIndex:
+    def __init__(self, calendar, schedule="daily"):
+        self.calendar = calendar
+        sessions = calendar.sessions
+        if schedule == "daily":
+            expiries = sessions
+        elif schedule == "weekly":
+            # Last session of each week: Friday, or Thursday when Friday is a holiday
+            expiries = array("l", (
+                s for i, s in enumerate(sessions)
+                if i + 1 == len(sessions) or date.fromordinal(sessions[i + 1]).weekday() <= date.fromordinal(s).weekday()
+            ))
+        else:
+            raise ValueError(f"Unknown expiry schedule: {schedule}")
+        self.expiries = expiries
+
+    def on_or_after(self, d):
+        i = bisect.bisect_left(self.expiries, d.toordinal())
+        return date.fromordinal(self.expiries[i]) if i < len(self.expiries) else None
+
+    def after(self, d):
+        i = bisect.bisect_right(self.expiries, d.toordinal())
+        return date.fromordinal(self.expiries[i]) if i < len(self.expiries) else None
+
+    def resolve(self, today, d1, d2):
+        near = self.on_or_after(today + timedelta(days=d1))
+        far = self.on_or_after(today + timedelta(days=d2))
+        if near is not None and far is not None and far <= near:
+            far = self.after(near)
+        if near is None or far is None:
+            return None
+        return near, far
+
+
+@lru_cache(maxsize=None)
+def _expiry_index(schedule, year):
+    return ExpiryIndex(TradingCalendar(date(year, 1, 1), date(year + 1, 12, 31)), schedule)
+
+
+def expiry_index(schedule="daily", today=None):
+    today = today or date.today()
+    return _expiry_index(schedule, today.year)